@@ -30,6 +30,7 @@ config.set_main_option("sqlalchemy.url", escaped_url)
 # ✅ Import models and metadata
 from app.utils.database import Base
 from app.auth.models import User
+from app.models.artifact import DocumentArtifact
 from app.models.documents import Document
 from app.models.chat import ChatHistory
 from app.models.translation import TranslationHistory
@@ -1,22 +1,32 @@
 import os
+import time
+import asyncio
 import logging
+import threading
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.utils.database import Base, engine, get_db
 from app.schemas import ChatRequest, ChatResponse
 from app.routes import documents, chatbot, summarize, translate, extract, download
 from app.auth import routes as auth_routes
+from app.auth.dependencies import get_current_user
 from app.auth.models import User
 from app.models.chat import ChatHistory
+from app.services import metrics
+from app.services.llm_clients import llm_clients
+from app.services.ocr import ocr_service  # registers OCR metrics
+from app.services.streaming import coalesce
 from app.services.rag import (
     get_rag_chain,
     get_rag_streaming_chain,
-    FastAPIStreamingCallbackHandler
+    FastAPIStreamingCallbackHandler,
+    warm_vectorstores
 )
 
 load_dotenv()
@@ -60,11 +70,13 @@ app.include_router(download.router, prefix="/export", tags=["Export & Download"]
 
 @app.on_event("startup")
 def preload_vectorstores():
-    root = "vectorstores"
-    os.makedirs(root, exist_ok=True)
-    for base_dir, _, files in os.walk(root):
-        if "index.faiss" in files:
-            logger.info(f"✅ Pre-loaded vectorstore: {base_dir}")
+    # Warm the most recently used indexes without holding up startup.
+    threading.Thread(target=warm_vectorstores, name="preload-vectorstores", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await llm_clients.aclose()
 
 
 @app.post("/chat", tags=["Chatbot"])
@@ -77,19 +89,32 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
 
 
 @app.post("/chat/stream", tags=["Chatbot"])
-def chat_stream(request: ChatRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(username=request.username).one()
-    history = db.query(ChatHistory).filter_by(user_id=user.id, name=request.doc_name).one()
+async def chat_stream(request: ChatRequest, db: Session = Depends(get_db)):
+    started = time.perf_counter()
+
+    def resolve():
+        # DB lookups and a cold session (FAISS load or build) stay off the event loop.
+        user = db.query(User).filter_by(username=request.username).one()
+        history = db.query(ChatHistory).filter_by(user_id=user.id, name=request.doc_name).one()
+        chain, _, _ = get_rag_streaming_chain(user.id, history.filename, user.domain)
+        return chain
+
+    chain = await run_in_threadpool(resolve)
     handler = FastAPIStreamingCallbackHandler()
-    chain = get_rag_streaming_chain(user.id, history.filename, user.domain, handler)
 
-    def event_generator():
-        chain.run(request.question)
-        while True:
-            tok = handler.queue.get()
-            if tok is None:
-                break
-            yield tok
+    async def run_chain():
+        try:
+            await chain.acall({"question": request.question}, callbacks=[handler])
+        finally:
+            await handler.queue.put(None)
+
+    async def event_generator():
+        task = asyncio.create_task(run_chain())
+        try:
+            async for piece in coalesce(handler.queue, started):
+                yield piece
+        finally:
+            task.cancel()
 
     return StreamingResponse(event_generator(), media_type="text/plain")
 
@@ -100,4 +125,10 @@ def chat_stream(request: ChatRequest, db: Session = Depends(get_db)):
 @app.get("/healthz", tags=["infra"])
 def healthz():
     return {"status": "ok"}
+
+
+@app.get("/metrics", tags=["infra"])
+def get_metrics(current_user: User = Depends(get_current_user)):
+    """Counters and latencies of the in-process services (OCR pool, caches, ...)."""
+    return metrics.snapshot()
 # ────────────────────────────────────────────────────────────────
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from app.utils.database import Base
+
+class DocumentArtifact(Base):
+    """Artifacts shared by every Document with the same content hash (blob, parsed text, FAISS index)."""
+    __tablename__ = "document_artifacts"
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the uploaded bytes
+    blob_url = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    size_bytes = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -11,4 +11,5 @@ class Document(Base):
     name = Column(String, nullable=False)
     filename = Column(String, nullable=False)
     blob_url = Column(String, nullable=True)  # ✅ Add this line
+    content_hash = Column(String(64), ForeignKey("document_artifacts.content_hash"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,11 +1,13 @@
 # app/routes/chatbot.py
 
+import time
 import asyncio
 import logging
 from typing import List
 import anyio
 from fastapi import APIRouter, Depends, HTTPException, Form, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.utils.database import get_db
@@ -15,28 +17,21 @@ from app.models.chat import ChatHistory
 from app.auth.models import User
 from app.services.rag import (
     get_rag_chain,
-    get_rag_streaming_chain,
+    get_chat_session,
+    get_retrieval_confidence,
+    fallback_stats,
     FastAPIStreamingCallbackHandler,
     get_llm_by_domain,
 )
+from app.services.llm_gateway import Priority, llm_gateway, model_of
+from app.services.streaming import coalesce
+from app.services.web_search import WEB_SEARCH_SPECULATIVE, web_search
 from app.services.firewall import get_client_ip, add_firewall_rule
 from app.schemas import ChatResponse
-from duckduckgo_search import DDGS
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# 🧠 DuckDuckGo web fallback
-def duckduckgo_search(query: str, max_results=3) -> str:
-    with DDGS() as ddgs:
-        results = ddgs.text(query)
-        output = ""
-        for i, r in enumerate(results, 1):
-            if i > max_results:
-                break
-            output += f"{i}. {r['title']}\n{r['body']}\n{r['href']}\n\n"
-        return output or "No relevant search result found."
-
 # 🚀 Non-Streaming Chat
 @router.post("/chat", response_model=ChatResponse)
 def chat_with_existing_documents(
@@ -61,13 +56,15 @@ def chat_with_existing_documents(
         chain = get_rag_chain(
             user_id=str(current_user.id),
             file_path=doc.blob_url,
-            domain=doc.domain
+            domain=doc.domain,
+            content_hash=doc.content_hash
         )
         prompt = f"""You are a helpful assistant. Answer the following question clearly:
 
 Question: {question}
 Answer:"""
 
+        # The chain admits its condense and answer calls through the LLM gateway.
         output = chain.invoke(prompt)
         answer = output["answer"]
 
@@ -88,7 +85,7 @@ Answer:"""
     return ChatResponse(reply=answer)
 
 
-# 🔁 Streaming Chat with Markdown & DuckDuckGo fallback
+# 🔁 Streaming Chat with DuckDuckGo fallback when retrieval confidence is low
 @router.post("/chat/stream", response_class=StreamingResponse)
 async def stream_chat_with_existing_documents(
     question: str = Form(...),
@@ -96,48 +93,54 @@ async def stream_chat_with_existing_documents(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    print("🟢 /chat/stream HIT")
-    print(f"👤 User ID: {current_user.id}")
-    print(f"📄 Doc Name: {doc_name}")
-    print(f"❓ Question: {question}")
+    started = time.perf_counter()
+    logger.info(f"🟢 /chat/stream user={current_user.id} doc={doc_name}")
 
     doc = db.query(Document).filter_by(user_id=current_user.id, name=doc_name).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found.")
 
     handler = FastAPIStreamingCallbackHandler()
+    # Optionally search the web while retrieval decides whether it is needed.
+    search = web_search.start(question) if WEB_SEARCH_SPECULATIVE else None
 
-    try:
-        # ✅ Unpack all 3 values returned
-        rag_chain, search_tool, llm = get_rag_streaming_chain(
+    def resolve():
+        # A cold session loads or builds the vectorstore, so keep it off the event loop.
+        session = get_chat_session(
             str(current_user.id),
             doc.blob_url,
             doc.domain,
-            handler
+            content_hash=doc.content_hash
         )
+        confidence = get_retrieval_confidence(session, question)
+        return (session.stream_chain, None, session.stream_llm), confidence
+
+    try:
+        # ✅ Unpack all 3 values returned
+        (rag_chain, search_tool, llm), confidence = await run_in_threadpool(resolve)
     except Exception as e:
         logger.exception("❌ Failed to build RAG streaming chain")
+        if search is not None:
+            search.cancel()
         raise HTTPException(status_code=500, detail="RAG chain init failed.")
 
-    async def event_generator():
-        buffer = ""
-
-        async with anyio.create_task_group() as tg:
-            async def run_chain():
-                try:
-                    result = await rag_chain.acall({"question": question})
-                    answer = result.get("answer", "").strip()
+    if search is not None and confidence.confident:
+        search.cancel()
 
-                    fallback_phrases = [
-                        "i don't know", "not sure", "not provided",
-                        "sorry", "unavailable", "couldn’t", "not found", ""
-                    ]
+    async def run_chain():
+        try:
+            fallback_stats.record(not confidence.confident)
+            if confidence.confident:
+                # Answer tokens reach the queue through the handler as they are generated;
+                # the chain takes its own gateway slots for the rewrite and answer models.
+                await rag_chain.acall({"question": question}, callbacks=[handler])
+                return
 
-                    if any(k in answer.lower() for k in fallback_phrases) or len(answer) < 5:
-                        print("⚠️ Weak RAG answer detected — using DuckDuckGo fallback...")
-                        web_data = duckduckgo_search(question)
+            logger.info(f"⚠️ Low retrieval confidence ({confidence.score}) — using DuckDuckGo fallback...")
+            fallback_started = time.perf_counter()
+            web_data = await (search or web_search.start(question))
 
-                        prompt = f"""
+            prompt = f"""
 You are an intelligent assistant. The document failed to answer the user's question.
 
 Here is a web result that might help:
@@ -149,38 +152,26 @@ Here is a web result that might help:
 Q: {question}
 A:"""
 
-                        async for chunk in llm.astream(prompt.strip()):
-                            await handler.queue.put(chunk)
-                    else:
-                        await handler.queue.put(answer)
-
-                except Exception:
-                    logger.exception("❌ Fallback also failed")
-                    await handler.queue.put("Sorry, I couldn’t retrieve any information.")
-                await handler.queue.put(None)
+            answer = ""
+            async with llm_gateway.aslot(model_of(llm), Priority.INTERACTIVE):
+                async for chunk in llm.astream(prompt.strip()):
+                    answer += chunk.content
+                    await handler.queue.put(chunk.content)
+            fallback_stats.fallback_latency.record(time.perf_counter() - fallback_started)
+            # Keep the exchange in the conversation so follow-ups have context.
+            rag_chain.memory.save_context({"question": question}, {"answer": answer})
+
+        except Exception:
+            logger.exception("❌ Streaming answer failed")
+            await handler.queue.put("Sorry, I couldn’t retrieve any information.")
+        finally:
+            await handler.queue.put(None)
 
+    async def event_generator():
+        async with anyio.create_task_group() as tg:
             tg.start_soon(run_chain)
-
-            while True:
-                token = await handler.queue.get()
-                if token is None:
-                    break
-
-                buffer += token
-                if any(p in token for p in [".", ",", "!", "?", " "]) or len(buffer) > 10:
-                    cleaned = (
-                        buffer.replace("  ", " ")
-                              .replace(" ,", ",")
-                              .replace(" .", ".")
-                              .replace(" !", "!")
-                              .replace(" ?", "?")
-                    )
-                    print("📤 Yielding:", repr(cleaned))
-                    yield cleaned
-                    buffer = ""
-
-            if buffer.strip():
-                yield buffer
+            async for piece in coalesce(handler.queue, started):
+                yield piece
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
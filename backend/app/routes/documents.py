@@ -1,26 +1,55 @@
 from fastapi import APIRouter, UploadFile, Form, File, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 from typing import List
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 import os, shutil, uuid
-from azure.storage.blob import BlobServiceClient, ContentSettings
+import asyncio
+import hashlib
 import logging
 from app.utils.database import get_db
 from app.models.documents import Document
+from app.models.artifact import DocumentArtifact
 from app.auth.models import User
 from app.auth.dependencies import get_current_user  # ⬅️ JWT-based user validation
+from app.services.formats import DOCX, DocumentFormat, UnsupportedFormatError, detect_format
+from app.services.ingestion import ingestion_queue
+from app.utils.azure_blob_utils import UPLOAD_BLOCK_SIZE, get_blob_service, upload_batch, upload_stream_to_blob
 
 router = APIRouter()
 
 # ✅ Local storage config
 UPLOAD_FOLDER = "uploaded_docs"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+KEEP_LOCAL_COPY = os.getenv("UPLOAD_KEEP_LOCAL_COPY", "1") == "1"
 
 # ✅ Azure config
-AZURE_CONN_STR = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 AZURE_CONTAINER = os.getenv("AZURE_BLOB_CONTAINER")
-blob_service = BlobServiceClient.from_connection_string(AZURE_CONN_STR)
+blob_service = get_blob_service()
 container_client = blob_service.get_container_client(AZURE_CONTAINER)
 
+logger = logging.getLogger(__name__)
+
+
+def _extension(fmt: DocumentFormat) -> str:
+    if fmt.kind == DOCX:
+        return ".docx"
+    return "." + fmt.content_type.split("/")[-1]
+
+
+async def hash_upload(file: UploadFile):
+    """SHA-256 and size of an upload, read block-wise from the spooled body."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        data = await file.read(UPLOAD_BLOCK_SIZE)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    await file.seek(0)
+    return digest.hexdigest(), size
+
 
 @router.post("/upload")
 async def upload_documents(
@@ -30,49 +59,101 @@ async def upload_documents(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Upload multiple documents to local storage and Azure Blob.
+    Upload multiple documents (PDF, DOCX or images) to local storage and Azure Blob.
     Store metadata in the database.
     """
     if len(files) != len(names):
         raise HTTPException(status_code=400, detail="Mismatch between files and names.")
 
-    uploaded_doc_ids = []
-
-    for i, file in enumerate(files):
-        # ✅ Step 1: Generate secure filename
-        file_id = str(uuid.uuid4())
-        secure_filename = f"{file_id}_{file.filename}".replace(" ", "_")
-        local_path = os.path.join(UPLOAD_FOLDER, secure_filename)
+    async def inspect(file: UploadFile):
+        # ✅ Step 1: Sniff the format from the leading bytes (never trust the extension)
+        try:
+            fmt = await run_in_threadpool(detect_format, file.file)
+        except UnsupportedFormatError as e:
+            raise HTTPException(status_code=415, detail=f"{file.filename}: {e}")
+
+        # ✅ Step 2: Hash the spooled upload; identical bytes share one artifact
+        content_hash, size = await hash_upload(file)
+        return fmt, content_hash, size
+
+    async def store(file: UploadFile, fmt, content_hash: str, size: int):
+        # ✅ Step 3: Name the artifact by its content hash; it is shared by every uploader of
+        # these bytes, so it must not carry anyone's original filename
+        secure_filename = f"{content_hash}{_extension(fmt)}"
+        local_path = os.path.join(UPLOAD_FOLDER, secure_filename) if KEEP_LOCAL_COPY else None
+        # Written under a unique name first: a concurrent upload of the same bytes targets the same path.
+        partial_path = f"{local_path}.{uuid.uuid4().hex}.part" if local_path else None
         blob_path = f"uploaded_docs/{secure_filename}"
 
-        # ✅ Step 2: Read file content (important!)
-        file_content = await file.read()
-
-        # ✅ Step 3: Save locally
-        with open(local_path, "wb") as f:
-            f.write(file_content)
-
-        # ✅ Step 4: Upload to Azure Blob using file_content
+        # ✅ Step 4: Stream to Azure Blob in blocks (+ optional local copy from the same blocks)
         try:
             blob_client = container_client.get_blob_client(blob_path)
-            blob_client.upload_blob(
-                data=file_content,
-                overwrite=True,
-                content_settings=ContentSettings(content_type="application/pdf")
-            )
+            await upload_stream_to_blob(file, blob_client, fmt.content_type, local_path=partial_path)
         except Exception as e:
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
             raise HTTPException(status_code=500, detail=f"Azure upload failed: {e}")
+        if partial_path:
+            os.replace(partial_path, local_path)
 
-        # ✅ Step 5: Construct Blob URL
+        # ✅ Step 5: Construct Blob URL for the artifact
         blob_url = f"https://{blob_service.account_name}.blob.core.windows.net/{AZURE_CONTAINER}/{blob_path}"
+        return DocumentArtifact(
+            content_hash=content_hash,
+            blob_url=blob_url,
+            filename=local_path or blob_url,
+            size_bytes=size
+        ), blob_path, local_path
+
+    async def discard(stored_upload):
+        """Remove an upload whose batch failed, unless another request recorded the same bytes."""
+        artifact, blob_path, local_path = stored_upload
+        if db.get(DocumentArtifact, artifact.content_hash) is not None:
+            return
+        try:
+            await run_in_threadpool(container_client.delete_blob, blob_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not delete orphaned blob {blob_path}: {e}")
+        if local_path and os.path.exists(local_path):
+            os.remove(local_path)
+
+    inspected = await asyncio.gather(*(inspect(file) for file in files))
+
+    # ✅ Upload each distinct content once: repeats within this request and
+    # bytes already stored reuse the same artifact
+    pending = {}
+    for file, (fmt, content_hash, size) in zip(files, inspected):
+        if content_hash in pending or db.get(DocumentArtifact, content_hash) is not None:
+            logger.info(f"♻️ Duplicate upload {file.filename} → artifact {content_hash[:12]}")
+            continue
+        pending[content_hash] = (file, fmt, size)
+
+    # ✅ The remaining files upload concurrently; if one fails, the others are removed again
+    stored = await upload_batch(
+        [store(file, fmt, content_hash, size) for content_hash, (file, fmt, size) in pending.items()],
+        discard,
+    )
+    for artifact, _, _ in stored:
+        try:
+            db.add(artifact)
+            db.commit()
+        except IntegrityError:
+            # Same bytes recorded concurrently by another request; both wrote the same blob.
+            db.rollback()
+            logger.info(f"♻️ Artifact {artifact.content_hash[:12]} recorded concurrently")
+
+    uploaded_doc_ids = []
+    for name, file, (_, content_hash, _) in zip(names, files, inspected):
+        artifact = db.get(DocumentArtifact, content_hash)
 
-        # ✅ Step 6: Save metadata to DB
+        # ✅ Step 6: Save metadata to DB (the uploader's own filename; storage is by content)
         doc = Document(
             user_id=current_user.id,
             domain=current_user.domain,
-            name=names[i],
-            filename=local_path,
-            blob_url=blob_url
+            name=name,
+            filename=file.filename,
+            blob_url=artifact.blob_url,
+            content_hash=artifact.content_hash
         )
         db.add(doc)
         db.commit()
@@ -80,13 +161,34 @@ async def upload_documents(
 
         uploaded_doc_ids.append(doc.id)
 
+        # ✅ Step 7: Start parsing/embedding in the background (no-op if the artifact is indexed)
+        ingestion_queue.submit(doc.id, str(current_user.id), doc.blob_url, content_hash=doc.content_hash)
+
     return {
         "uploaded_documents": uploaded_doc_ids,
         "domain": current_user.domain,
         "user": current_user.username
     }
 
-logger = logging.getLogger(__name__)
+@router.get("/{doc_id}/status")
+def get_document_status(
+    doc_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ingestion status of a document: queued, parsing, embedding, ready or failed.
+    Documents with no tracked job (e.g. after a restart) are re-queued.
+    """
+    doc = db.query(Document).filter_by(id=doc_id, user_id=current_user.id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    job = ingestion_queue.get(doc.id)
+    if job is None:
+        job = ingestion_queue.submit(doc.id, str(current_user.id), doc.blob_url, content_hash=doc.content_hash)
+    return {"name": doc.name, **job.to_dict()}
+
 @router.get("/documents/me")
 def get_user_documents(
     db: Session = Depends(get_db),
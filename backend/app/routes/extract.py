@@ -3,8 +3,9 @@ from sqlalchemy.orm import Session
 from app.utils.database import get_db
 from app.models.documents import Document
 from app.models.extraction import DocumentExtraction
-from app.services.utils import load_and_chunk_pdf
+from app.services.utils import load_and_chunk_document
 from app.services.rag import get_llm_by_domain
+from app.services.llm_gateway import Priority, llm_gateway
 
 router = APIRouter()
 
@@ -36,7 +37,7 @@ def extract_keywords_from_document(
 
     # ✅ Step 2: Load document content
     try:
-        chunks = load_and_chunk_pdf(doc.filename)
+        chunks = load_and_chunk_document(doc.blob_url, profile="extract")
         full_text = "\n".join(chunk.page_content for chunk in chunks)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load document: {e}")
@@ -83,7 +84,7 @@ def extract_keywords_from_document(
     # ✅ Step 4: Call domain-specific LLM
     try:
         llm = get_llm_by_domain(domain)
-        llm_output = llm.invoke(prompt)
+        llm_output = llm_gateway.invoke(llm, prompt, priority=Priority.BATCH)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM inference failed: {e}")
 
@@ -3,8 +3,9 @@ from sqlalchemy.orm import Session
 from app.utils.database import get_db
 from app.models.documents import Document
 from app.models.summary import SummaryHistory
-from app.services.utils import load_and_chunk_pdf
+from app.services.utils import load_and_chunk_document
 from app.services.rag import get_llm_by_domain
+from app.services.llm_gateway import Priority, llm_gateway
 from app.auth.dependencies import get_current_user
 from app.auth.models import User
 
@@ -32,7 +33,7 @@ async def summarize_document(
 
     # ✅ Step 2: Load and chunk the document from Azure Blob
     try:
-        chunks = load_and_chunk_pdf(doc.blob_url)  # Uses blob_url internally
+        chunks = load_and_chunk_document(doc.blob_url, profile="summarize")  # Uses blob_url internally
         if not chunks:
             raise ValueError("No readable content extracted from document.")
     except Exception as e:
@@ -57,7 +58,7 @@ async def summarize_document(
             f"{chunk.page_content}"
         )
         try:
-            result = llm.invoke(prompt)
+            result = await llm_gateway.ainvoke(llm, prompt, priority=Priority.BATCH)
             partial_summaries.append(result.content.strip())
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Chunk {i+1} summarization failed: {str(e)}")
@@ -69,7 +70,7 @@ async def summarize_document(
         f"approximately {target_words} words:\n\n{combined_summary}"
     )
     try:
-        final_summary = llm.invoke(final_prompt).content.strip()
+        final_summary = (await llm_gateway.ainvoke(llm, final_prompt, priority=Priority.BATCH)).content.strip()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Final summary generation failed: {str(e)}")
 
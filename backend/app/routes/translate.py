@@ -1,16 +1,43 @@
 from fastapi import APIRouter, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import Literal
+import re
+from typing import Dict, Literal
 
 from app.utils.database import get_db
 from app.models.documents import Document
-from app.services.utils import load_and_chunk_pdf
+from app.services.utils import load_and_chunk_document
+from app.services.chunking import count_tokens
+from app.services.dedup import expand_folded
 from app.services.rag import get_llm_by_domain
+from app.services.llm_gateway import LLM_OUTPUT_TOKENS_ESTIMATE, Priority, llm_gateway
 from app.auth.dependencies import get_current_user
 from app.auth.models import User
 
 router = APIRouter()
 
+_NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)[.):]\s*(.*\S)\s*$")
+
+
+async def _translate_folded_lines(llm, lines: Dict[int, str], target_language: str) -> Dict[int, str]:
+    """
+    Translate the distinct folded header/footer lines in one call. A line the
+    model drops or renumbers keeps its original text rather than failing.
+    """
+    numbered = "\n".join(f"{ref}. {text}" for ref, text in sorted(lines.items()))
+    prompt = (
+        f"You are a professional translator.\n"
+        f"Translate each numbered line below into {target_language}.\n"
+        f"Answer with the same numbered lines, one per line, and nothing else.\n\n"
+        f"{numbered}"
+    )
+    result = await llm_gateway.ainvoke(llm, prompt, priority=Priority.BATCH, output_tokens=count_tokens(numbered))
+    translated = dict(lines)
+    for line in (result.content or "").splitlines():
+        match = _NUMBERED_LINE_RE.match(line)
+        if match and int(match.group(1)) in lines:
+            translated[int(match.group(1))] = match.group(2)
+    return translated
+
 @router.post("/translate")
 async def translate_document(
     doc_name: str = Form(..., description="Name of the document to translate"),
@@ -34,7 +61,7 @@ async def translate_document(
 
     # ✅ Step 2: Load and chunk document from Azure Blob Storage
     try:
-        chunks = load_and_chunk_pdf(doc.blob_url)
+        chunks = load_and_chunk_document(doc.blob_url, profile="translate")
         if not chunks:
             raise ValueError("No readable content extracted from document.")
     except Exception as e:
@@ -48,24 +75,40 @@ async def translate_document(
 
     # ✅ Step 4: Translate each chunk with safety checks and logs
     translated_chunks = []
+    translations = {}  # chunk_index -> translation, to re-expand folded repeats
+    folded_lines = {}  # fold ref -> repeated header/footer line, translated once at the end
 
     for i, chunk in enumerate(chunks):
+        original = chunk.metadata.get("duplicate_of")
+        if original in translations:
+            print(f"♻️ Chunk {i+1} repeats chunk {original + 1}; reusing its translation")
+            translated_chunks.append(translations[original])
+            continue
+
         chunk_text = chunk.page_content.strip()
         if not chunk_text:
             print(f"⚠️ Skipping empty chunk {i+1}")
             continue
+        folded_lines.update(chunk.metadata.get("folded_lines", {}))
 
         prompt = (
             f"You are a professional translator.\n"
             f"Translate the following document into {target_language}.\n"
-            f"Preserve formatting, names, lists, and numbers.\n\n"
+            f"Preserve formatting, names, lists, and numbers.\n"
+            f"Copy placeholders such as ⟦0⟧ unchanged, each on its own line.\n\n"
             f"{chunk_text}"
         )
 
         print(f"\n🔹 [Chunk {i+1}] Prompt Preview:\n{prompt[:300]}...\n")
 
         try:
-            result = llm.invoke(prompt)
+            # A translation is about as long as its source.
+            result = await llm_gateway.ainvoke(
+                llm,
+                prompt,
+                priority=Priority.BATCH,
+                output_tokens=chunk.metadata.get("token_count", LLM_OUTPUT_TOKENS_ESTIMATE)
+            )
 
             if not result:
                 raise ValueError("LLM returned None")
@@ -75,6 +118,7 @@ async def translate_document(
                 raise ValueError("LLM returned empty translation")
 
             translated_chunks.append(result.content.strip())
+            translations[chunk.metadata.get("chunk_index", i)] = translated_chunks[-1]
 
         except Exception as e:
             raise HTTPException(
@@ -82,7 +126,15 @@ async def translate_document(
                 detail=f"❌ Translation failed at chunk {i+1}: {str(e)}"
             )
 
-    # ✅ Step 5: Return final result
+    # ✅ Step 5: Re-expand folded header/footer lines with their translation
+    if folded_lines:
+        try:
+            line_translations = await _translate_folded_lines(llm, folded_lines, target_language)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"❌ Translation of repeated lines failed: {str(e)}")
+        translated_chunks = [expand_folded(text, line_translations) for text in translated_chunks]
+
+    # ✅ Step 6: Return final result
     final_translation = "\n\n".join(translated_chunks)
 
     return {
@@ -0,0 +1,157 @@
+# app/services/chat_engine.py
+
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+
+from app.services import metrics
+from app.services.chunking import count_tokens
+from app.services.llm_gateway import Priority, llm_gateway, model_of
+
+# ---------------------------------------
+# ✅ Question rewrite settings
+# ---------------------------------------
+# Small, fast model for condensing a follow-up into a standalone question.
+REWRITE_MODEL = os.getenv("REWRITE_MODEL", "llama-3.1-8b-instant")
+# Questions this short ("why?", "and the second?") lean on the previous turn.
+REWRITE_MAX_SHORT_WORDS = int(os.getenv("REWRITE_MAX_SHORT_WORDS", "3"))
+# A standalone question is short; charged up front to the rewrite model's bucket.
+REWRITE_OUTPUT_TOKENS = int(os.getenv("REWRITE_OUTPUT_TOKENS", "64"))
+
+# Words that only make sense with the previous turn in view.
+_ANAPHORA = re.compile(
+    r"\b(it|its|it's|itself|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"former|latter|above|aforementioned|same|such|there|then|else|another|other|others|previous|"
+    r"earlier|again|more|further|elaborate|continue|also)\b",
+    re.IGNORECASE,
+)
+# Elliptical openers: "and the fees?", "what about 2023?", "same for Q3".
+_ELLIPSIS = re.compile(r"^\s*(and|or|but|so|also|what about|how about|why not|same)\b", re.IGNORECASE)
+
+
+def needs_rewrite(question: str, chat_history: Any) -> bool:
+    """Cheap local check whether `question` depends on the conversation so far."""
+    if not chat_history:
+        return False
+    if _ELLIPSIS.search(question) or "..." in question or "…" in question:
+        return True
+    if len(question.split()) <= REWRITE_MAX_SHORT_WORDS:
+        return True
+    return bool(_ANAPHORA.search(question))
+
+
+class RewriteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.skipped_no_history = 0
+        self.skipped_standalone = 0
+        self.rewrites = 0
+
+    def record(self, has_history: bool, rewrite: bool) -> None:
+        with self._lock:
+            self.questions += 1
+            if rewrite:
+                self.rewrites += 1
+            elif has_history:
+                self.skipped_standalone += 1
+            else:
+                self.skipped_no_history += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            skipped = self.skipped_no_history + self.skipped_standalone
+            return {
+                "model": REWRITE_MODEL,
+                "questions": self.questions,
+                "rewrites": self.rewrites,
+                "skipped": skipped,
+                "skipped_no_history": self.skipped_no_history,
+                "skipped_standalone": self.skipped_standalone,
+                "skip_rate": round(skipped / self.questions, 4) if self.questions else 0.0,
+            }
+
+
+rewrite_stats = RewriteStats()
+metrics.register("chat_rewrite", rewrite_stats.snapshot)
+
+
+class RetrievalChatEngine(ConversationalRetrievalChain):
+    """
+    ConversationalRetrievalChain that only condenses the question against
+    the chat history when `needs_rewrite` says it depends on it; otherwise
+    the question goes to retrieval as asked, saving an LLM round trip.
+    Memory still records every turn.
+
+    Both LLM steps go through the gateway, each charged to its own model:
+    the condense call to the rewrite model, retrieval plus answer to the
+    answer model. A streaming answer is admitted but never retried, since
+    its tokens may already have been sent.
+    """
+
+    gateway_priority: Priority = Priority.INTERACTIVE
+    retry_answer: bool = True
+
+    def _route(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """Chat history to condense the question against, or None to use it as asked."""
+        history = inputs.get("chat_history")
+        rewrite = needs_rewrite(inputs["question"], history)
+        rewrite_stats.record(bool(history), rewrite)
+        if not rewrite:
+            return None
+        return (self.get_chat_history or _get_chat_history)(history) or None
+
+    def _rewrite_tokens(self, question: str, chat_history: str) -> int:
+        return count_tokens(chat_history) + count_tokens(question) + REWRITE_OUTPUT_TOKENS
+
+    @property
+    def _answer_model(self) -> str:
+        return model_of(self.combine_docs_chain.llm_chain.llm)
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        question, chat_history = inputs["question"], self._route(inputs)
+        if chat_history:
+            asked, callbacks = question, run_manager.get_child() if run_manager else None
+            question = llm_gateway.call(
+                model_of(self.question_generator.llm),
+                lambda: self.question_generator.run(question=asked, chat_history=chat_history, callbacks=callbacks),
+                self.gateway_priority,
+                self._rewrite_tokens(question, chat_history),
+            )
+        # An empty history makes the base chain use the (condensed) question unchanged.
+        routed = {**inputs, "question": question, "chat_history": []}
+        answer = lambda: ConversationalRetrievalChain._call(self, routed, run_manager=run_manager)
+        if self.retry_answer:
+            return llm_gateway.call(self._answer_model, answer, self.gateway_priority)
+        with llm_gateway.slot(self._answer_model, self.gateway_priority):
+            return answer()
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        question, chat_history = inputs["question"], self._route(inputs)
+        if chat_history:
+            asked, callbacks = question, run_manager.get_child() if run_manager else None
+            question = await llm_gateway.acall(
+                model_of(self.question_generator.llm),
+                lambda: self.question_generator.arun(question=asked, chat_history=chat_history, callbacks=callbacks),
+                self.gateway_priority,
+                self._rewrite_tokens(question, chat_history),
+            )
+        routed = {**inputs, "question": question, "chat_history": []}
+        answer = lambda: ConversationalRetrievalChain._acall(self, routed, run_manager=run_manager)
+        if self.retry_answer:
+            return await llm_gateway.acall(self._answer_model, answer, self.gateway_priority)
+        async with llm_gateway.aslot(self._answer_model, self.gateway_priority):
+            return await answer()
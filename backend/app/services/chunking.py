@@ -0,0 +1,293 @@
+# app/services/chunking.py
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tiktoken
+from langchain_core.documents import Document as LangDoc
+
+from app.services.extraction import PageText
+
+# ---------------------------------------
+# ✅ Chunking settings
+# ---------------------------------------
+# cl100k_base is close enough to the Llama 3 tokenizer for budgeting prompts.
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+# BPE files shipped with the image, named as tiktoken's cache names them
+# (sha1 of the download URL), so chunking never needs network access.
+# An explicit TIKTOKEN_CACHE_DIR wins.
+BUNDLED_ENCODINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings")
+PAGE_SEPARATOR = "\n\n"
+CHUNKER_VERSION = "1"
+# A short line among the first or last BOILERPLATE_EDGE_LINES lines of a page
+# (header, footer, disclaimer, page number) is boilerplate once it has appeared
+# on this many earlier pages; page numbers and dates are ignored when comparing.
+# Used by app.services.dedup; defined here because they are part of the cache key.
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_EDGE_LINES = int(os.getenv("BOILERPLATE_EDGE_LINES", "2"))
+
+ChunkBounds = Tuple[int, int, int]  # (start char, end char, token count)
+
+
+@dataclass(frozen=True)
+class ChunkProfile:
+    """Chunk size and overlap in model tokens for one kind of consumer."""
+    name: str
+    max_tokens: int
+    overlap_tokens: int
+    # Repeated chunks are dropped ("drop") or kept with a reference ("fold").
+    dedup: str = "drop"
+    # Repeated header/footer lines are dropped, folded into references, or kept ("keep").
+    boilerplate: str = "drop"
+
+    @property
+    def cache_key(self) -> str:
+        key = f"tokens-v{CHUNKER_VERSION}:{CHUNK_ENCODING}:{self.name}:{self.max_tokens}:{self.overlap_tokens}"
+        # Chunk bounds depend on the text after boilerplate removal.
+        if self.boilerplate == "drop":
+            return f"{key}:boilerplate-edge-{BOILERPLATE_MIN_PAGES}-{BOILERPLATE_EDGE_LINES}"
+        if self.boilerplate == "fold":
+            return f"{key}:boilerplate-fold-edge-{BOILERPLATE_MIN_PAGES}-{BOILERPLATE_EDGE_LINES}"
+        return key
+
+
+def _profile(name: str, max_tokens: int, overlap_tokens: int, **options) -> ChunkProfile:
+    env = name.upper()
+    return ChunkProfile(
+        name=name,
+        max_tokens=int(os.getenv(f"CHUNK_{env}_TOKENS", str(max_tokens))),
+        overlap_tokens=int(os.getenv(f"CHUNK_{env}_OVERLAP", str(overlap_tokens))),
+        **options,
+    )
+
+
+# Retrieval wants small, focused chunks. Summarize/extract use most of the
+# 8k context window; translate leaves room for an output as long as the input
+# and folds repeated headers/footers and chunks so the output can be re-expanded.
+CHUNK_PROFILES: Dict[str, ChunkProfile] = {
+    profile.name: profile
+    for profile in (
+        _profile("retrieval", 256, 32),
+        _profile("summarize", 5500, 0),
+        _profile("translate", 3000, 0, dedup="fold", boilerplate="fold"),
+        _profile("extract", 6000, 0),
+    )
+}
+
+
+def get_profile(profile: str) -> ChunkProfile:
+    try:
+        return CHUNK_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown chunk profile '{profile}' (expected one of {sorted(CHUNK_PROFILES)})")
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> tiktoken.Encoding:
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", BUNDLED_ENCODINGS_DIR)
+    return tiktoken.get_encoding(CHUNK_ENCODING)
+
+
+@lru_cache(maxsize=1)
+def _token_byte_lengths() -> np.ndarray:
+    """UTF-8 byte length of every token id, so offsets can be computed with NumPy."""
+    enc = _encoding()
+    lengths = np.zeros(enc.max_token_value + 1, dtype=np.int64)
+    for token in range(enc.max_token_value + 1):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # unused ids / special tokens never appear in encode_ordinary output
+    return lengths
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode_ordinary(text))
+
+
+# ---------------------------------------
+# ✅ Document layout
+# ---------------------------------------
+def _segments(pages: Sequence[PageText]) -> Tuple[List[PageText], List[str]]:
+    kept = [page for page in pages if page.text.strip()]
+    return kept, [page.text.rstrip() + PAGE_SEPARATOR for page in kept]
+
+
+@dataclass
+class DocumentText:
+    """Pages joined into one string, with the char offset where each page starts."""
+    text: str
+    page_starts: np.ndarray
+    page_numbers: np.ndarray
+    ocr_pages: List[int]
+
+
+def document_text(pages: Sequence[PageText]) -> DocumentText:
+    kept, segments = _segments(pages)
+    lengths = np.fromiter((len(s) for s in segments), dtype=np.int64, count=len(segments))
+    return DocumentText(
+        text="".join(segments),
+        page_starts=np.cumsum(lengths) - lengths,
+        page_numbers=np.fromiter((p.page_number for p in kept), dtype=np.int64, count=len(kept)),
+        ocr_pages=[p.page_number for p in kept if p.ocr],
+    )
+
+
+def _chunk_documents(
+    text: str,
+    text_start: int,
+    bounds: Sequence[ChunkBounds],
+    page_starts: np.ndarray,
+    page_numbers: np.ndarray,
+    ocr_pages: Sequence[int],
+    metadata: Optional[dict],
+) -> List[LangDoc]:
+    """LangChain documents for `bounds`; `text` holds the document from char `text_start` on."""
+    if not bounds:
+        return []
+    begins = np.fromiter((b[0] for b in bounds), dtype=np.int64, count=len(bounds))
+    ends = np.fromiter((b[1] for b in bounds), dtype=np.int64, count=len(bounds))
+    first_idx = np.searchsorted(page_starts, begins, side="right") - 1
+    last_idx = np.searchsorted(page_starts, np.maximum(ends - 1, begins), side="right") - 1
+    first_pages = page_numbers[np.clip(first_idx, 0, None)].tolist()
+    last_pages = page_numbers[np.clip(last_idx, 0, None)].tolist()
+
+    chunks = []
+    for (begin, end, n_tokens), page, page_end in zip(bounds, first_pages, last_pages):
+        content = text[begin - text_start:end - text_start]
+        if not content.strip():
+            continue
+        chunks.append(LangDoc(
+            page_content=content,
+            metadata={
+                **(metadata or {}),
+                "page": page,
+                "page_end": page_end,
+                "start_index": begin,
+                "end_index": end,
+                "token_count": n_tokens,
+                "ocr_pages": [p for p in ocr_pages if page <= p <= page_end],
+            },
+        ))
+    return chunks
+
+
+def build_chunks(doc: DocumentText, bounds: Sequence[ChunkBounds], metadata: Optional[dict] = None) -> List[LangDoc]:
+    """Rebuild chunks from cached bounds without tokenizing again."""
+    return _chunk_documents(doc.text, 0, bounds, doc.page_starts, doc.page_numbers, doc.ocr_pages, metadata)
+
+
+# ---------------------------------------
+# ✅ Token windows
+# ---------------------------------------
+def _token_offsets(text: str, segments: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Char offsets (begin, end) of every token of `text`, the concatenation of
+    `segments`. Segments are encoded in one batched call; mapping token ->
+    byte offset -> char offset is vectorized.
+    """
+    token_lists = _encoding().encode_ordinary_batch(segments)
+    tokens = np.fromiter((t for ids in token_lists for t in ids), dtype=np.int64)
+    byte_offsets = np.concatenate(([0], np.cumsum(_token_byte_lengths()[tokens])))
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    char_starts = (data & 0xC0) != 0x80
+    chars_before_byte = np.concatenate(([0], np.cumsum(char_starts)))
+    char_offsets = chars_before_byte[byte_offsets]
+    return char_offsets[:-1], char_offsets[1:]
+
+
+class TokenChunker:
+    """
+    Cuts a document into windows of `max_tokens` tokens overlapping by
+    `overlap_tokens`. Pages are fed in order and in batches; each call
+    returns the chunks completed so far. Only the tokens and text of the
+    unfinished window are kept, so memory does not grow with page count,
+    and the windows are the same however the pages are batched.
+    """
+
+    def __init__(self, profile: ChunkProfile, metadata: Optional[dict] = None):
+        self.profile = profile
+        self.metadata = metadata or {}
+        self.bounds: List[ChunkBounds] = []
+        self._length = 0          # chars fed so far
+        self._text = ""           # document text from char `_text_start` on
+        self._text_start = 0
+        self._tok_begin = np.zeros(0, dtype=np.int64)  # pending tokens' char offsets
+        self._tok_end = np.zeros(0, dtype=np.int64)
+        self._tokens_done = 0
+        self._page_starts: List[int] = []
+        self._page_numbers: List[int] = []
+        self._ocr_pages: List[int] = []
+
+    def feed(self, pages: Sequence[PageText]) -> List[LangDoc]:
+        kept, segments = _segments(pages)
+        if not kept:
+            return []
+        offset = self._length
+        for page, segment in zip(kept, segments):
+            self._page_starts.append(offset)
+            self._page_numbers.append(page.page_number)
+            if page.ocr:
+                self._ocr_pages.append(page.page_number)
+            offset += len(segment)
+
+        text = "".join(segments)
+        begin, end = _token_offsets(text, segments)
+        self._tok_begin = np.concatenate((self._tok_begin, begin + self._length))
+        self._tok_end = np.concatenate((self._tok_end, end + self._length))
+        self._text += text
+        self._length = offset
+        return self._emit(final=False)
+
+    def finish(self) -> List[LangDoc]:
+        return self._emit(final=True)
+
+    def _emit(self, final: bool) -> List[LangDoc]:
+        n_tokens = len(self._tok_begin)
+        max_tokens, overlap = self.profile.max_tokens, self.profile.overlap_tokens
+        step = max(1, max_tokens - overlap)
+
+        if final:
+            starts = np.arange(0, n_tokens, step)
+            # drop trailing windows that would only repeat the previous overlap
+            keep = starts + overlap < n_tokens
+            if self._tokens_done == 0:
+                keep |= starts == 0
+            starts = starts[keep]
+            consumed = n_tokens
+        elif n_tokens >= max_tokens:
+            # only windows that are complete; the rest waits for more pages
+            starts = np.arange(0, (n_tokens - max_tokens) // step * step + 1, step)
+            consumed = len(starts) * step
+        else:
+            return []
+
+        ends = np.minimum(starts + max_tokens, n_tokens)
+        bounds = list(zip(
+            self._tok_begin[starts].tolist(),
+            self._tok_end[ends - 1].tolist(),
+            (ends - starts).tolist(),
+        ))
+        chunks = _chunk_documents(
+            self._text, self._text_start, bounds,
+            np.asarray(self._page_starts, dtype=np.int64),
+            np.asarray(self._page_numbers, dtype=np.int64),
+            self._ocr_pages, self.metadata,
+        )
+        self.bounds.extend(bounds)
+
+        self._tok_begin = self._tok_begin[consumed:]
+        self._tok_end = self._tok_end[consumed:]
+        self._tokens_done += consumed
+        keep_from = int(self._tok_begin[0]) if len(self._tok_begin) else self._length
+        self._text = self._text[keep_from - self._text_start:]
+        self._text_start = keep_from
+        return chunks
+
+
+def chunk_pages(pages: Sequence[PageText], profile: str = "retrieval", metadata: Optional[dict] = None) -> List[LangDoc]:
+    chunker = TokenChunker(get_profile(profile), metadata)
+    return chunker.feed(pages) + chunker.finish()
@@ -0,0 +1,306 @@
+# app/services/dedup.py
+
+import os
+import re
+import zlib
+import hashlib
+import threading
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document as LangDoc
+
+from app.services import metrics
+from app.services.chunking import BOILERPLATE_EDGE_LINES, BOILERPLATE_MIN_PAGES, count_tokens
+from app.services.extraction import PageText
+
+# ---------------------------------------
+# ✅ De-duplication settings
+# ---------------------------------------
+# Longer lines are treated as content and never stripped as boilerplate.
+BOILERPLATE_MAX_LINE_CHARS = 200
+# Chunks whose 64-bit SimHash differs in at most this many bits are near-duplicates.
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "6"))
+SHINGLE_WORDS = 3
+
+DROP = "drop"  # duplicates are removed from the stream
+FOLD = "fold"  # duplicates are replaced by a reference to their first occurrence
+KEEP = "keep"  # boilerplate lines are left in place
+
+# A folded line is replaced by this marker; `n` indexes BoilerplateFilter.folded.
+FOLD_MARKER = "⟦{}⟧"
+
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+_FOLD_MARKER_RE = re.compile(r"⟦(\d+)⟧")
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+# 2024-03-01, 01/03/2024, 1.3.24, March 1, 2024, 1 March 2024
+_DATE_RE = re.compile(
+    r"\b\d{1,4}[./-]\d{1,2}[./-]\d{1,4}\b"
+    rf"|\b{_MONTH}\s+\d{{1,2}},?\s+\d{{4}}\b"
+    rf"|\b\d{{1,2}}\s+{_MONTH}\s+\d{{4}}\b"
+)
+# "page 3", "p. 3 of 10", "pg 3/10", or a line that is only "3", "- 3 -", "3 / 10"
+_PAGE_NUMBER_RE = re.compile(
+    r"\b(?:page|pg|p)\.?\s*\d+(?:\s*(?:of|/)\s*\d+)?\b"
+    r"|^[^\w]*\d+(?:\s*(?:of|/)\s*\d+)?[^\w]*$"
+)
+
+
+def numbers_key(text: str) -> np.uint64:
+    """64-bit hash of the sequence of numbers in `text`."""
+    digest = hashlib.sha1("\x00".join(_DIGITS_RE.findall(text)).encode("utf-8")).digest()
+    return np.uint64(int.from_bytes(digest[:8], "little"))
+
+
+def fold_text(text: str) -> str:
+    """Case- and whitespace-folded text; digits are kept."""
+    return " ".join(text.lower().split())
+
+
+def normalize_line(line: str) -> str:
+    """
+    Header/footer key: page numbers and dates vary between pages, so they
+    are masked. Other figures are kept; a line that differs in an amount or
+    a quantity is a different line.
+    """
+    return _PAGE_NUMBER_RE.sub("#", _DATE_RE.sub("#", fold_text(line)))
+
+
+# ---------------------------------------
+# ✅ Repeated header/footer lines
+# ---------------------------------------
+@dataclass
+class FoldedLine:
+    text: str
+    page: int  # page of the first occurrence
+
+
+class BoilerplateFilter:
+    """
+    Removes header/footer lines that repeat across pages. Only the first and
+    last `edge_lines` non-blank lines of a page are candidates; body text is
+    never touched. Works on the page stream: a line is kept the first
+    `min_pages` times it appears and dropped after that, so the result is
+    the same however pages are batched. Returns copies; the input pages
+    (which go to the parse cache) are never modified.
+
+    In FOLD mode a repeated line is replaced by a FOLD_MARKER pointing at
+    its entry in `folded` instead, so a consumer can process each distinct
+    line once and re-expand it with `expand_folded`. Lines are compared
+    verbatim there (whitespace aside), since the expansion must be faithful.
+    """
+
+    def __init__(self, min_pages: int = BOILERPLATE_MIN_PAGES, mode: str = DROP, edge_lines: int = BOILERPLATE_EDGE_LINES):
+        self.min_pages = min_pages
+        self.edge_lines = edge_lines
+        self.mode = mode
+        self.folded: List[FoldedLine] = []
+        self._refs: Dict[str, int] = {}
+        self._pages_seen: Dict[str, int] = {}
+        self.lines_removed = 0
+        self.tokens_removed = 0
+
+    def apply(self, pages: Sequence[PageText]) -> List[PageText]:
+        result = []
+        for page in pages:
+            kept, on_page = [], set()
+            lines = page.text.splitlines()
+            edges = self._edge_indexes(lines)
+            for i, line in enumerate(lines):
+                if i not in edges:
+                    kept.append(line)
+                    continue
+                key = normalize_line(line) if self.mode == DROP else " ".join(line.split())
+                if not key or len(key) > BOILERPLATE_MAX_LINE_CHARS:
+                    kept.append(line)
+                    continue
+                if key not in on_page and self._pages_seen.get(key, 0) >= self.min_pages:
+                    self.lines_removed += 1
+                    self.tokens_removed += count_tokens(line)
+                    if self.mode == FOLD:
+                        marker = FOLD_MARKER.format(self._fold(key, line, page.page_number))
+                        self.tokens_removed -= count_tokens(marker)
+                        kept.append(marker)
+                    continue
+                on_page.add(key)
+                kept.append(line)
+            for key in on_page:
+                self._pages_seen[key] = self._pages_seen.get(key, 0) + 1
+            result.append(replace(page, text="\n".join(kept)))
+        return result
+
+    def _edge_indexes(self, lines: List[str]) -> set:
+        """Indexes of the first and last `edge_lines` non-blank lines."""
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        return set(filled[:self.edge_lines]) | set(filled[-self.edge_lines:] if self.edge_lines else [])
+
+    def _fold(self, key: str, line: str, page: int) -> int:
+        ref = self._refs.get(key)
+        if ref is None:
+            ref = self._refs[key] = len(self.folded)
+            self.folded.append(FoldedLine(text=line.strip(), page=page))
+        return ref
+
+    def annotate(self, chunks: Sequence[LangDoc]) -> List[LangDoc]:
+        """Attach the folded lines a chunk refers to as `folded_lines` (ref -> text)."""
+        for chunk in chunks:
+            refs = {int(ref) for ref in _FOLD_MARKER_RE.findall(chunk.page_content)}
+            if refs:
+                chunk.metadata["folded_lines"] = {ref: self.folded[ref].text for ref in sorted(refs)}
+        return list(chunks)
+
+
+def expand_folded(text: str, lines: Dict[int, str]) -> str:
+    """Replace fold markers with their line from `lines` (e.g. its translation)."""
+    return _FOLD_MARKER_RE.sub(lambda m: lines.get(int(m.group(1)), m.group(0)), text)
+
+
+# ---------------------------------------
+# ✅ SimHash near-duplicate chunks
+# ---------------------------------------
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer (uint64 arithmetic wraps)."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def simhash(text: str) -> np.uint64:
+    """
+    64-bit SimHash over word shingles; similar texts differ in few bits.
+    Numbers are words like any other, so chunks that differ only in their
+    figures (invoice lines, tables, dosages) never collapse into one.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.uint64(0)
+    ids = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    width = min(SHINGLE_WORDS, len(ids))
+    count = len(ids) - width + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(width):
+        shingles = _mix64(shingles ^ ids[offset:offset + count])
+    bits = (shingles[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = bits.sum(axis=0) * 2 > count
+    return np.uint64((votes.astype(np.uint64) << _BIT_SHIFTS).sum())
+
+
+@dataclass
+class DedupStats:
+    chunks: int = 0
+    duplicates: int = 0
+    duplicate_tokens: int = 0
+    boilerplate_lines: int = 0
+    boilerplate_tokens: int = 0
+
+    def to_dict(self, profile: str) -> dict:
+        tokens_saved = self.duplicate_tokens + self.boilerplate_tokens
+        return {
+            "chunks": self.chunks,
+            "duplicates": self.duplicates,
+            "boilerplate_lines": self.boilerplate_lines,
+            # Retrieval chunks are embedded once each; other profiles send chunks to the LLM.
+            "embedding_calls_saved": self.duplicates if profile == "retrieval" else 0,
+            "llm_tokens_saved": tokens_saved if profile != "retrieval" else 0,
+            "tokens_saved": tokens_saved,
+        }
+
+
+class ChunkDeduplicator:
+    """
+    Numbers chunks (`chunk_index`) and detects repeats among them.
+
+    In DROP mode near-duplicates (SimHash within `max_distance` bits, with
+    the same numbers in the same order) are removed. FOLD mode keeps every
+    chunk but marks exact repeats (after whitespace normalization) with
+    `duplicate_of`, so a consumer can process the original once and
+    re-expand the result; only exact repeats are folded there because the
+    re-expanded output must stay faithful.
+    """
+
+    def __init__(self, mode: str = DROP, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.mode = mode
+        self.max_distance = max_distance
+        self.stats = DedupStats()
+        self._exact: Dict[str, int] = {}
+        self._fingerprints = np.zeros(256, dtype=np.uint64)
+        self._numbers = np.zeros(256, dtype=np.uint64)
+        self._indexes: List[int] = []
+
+    def apply(self, chunks: Sequence[LangDoc]) -> List[LangDoc]:
+        result = []
+        for chunk in chunks:
+            index = self.stats.chunks
+            self.stats.chunks += 1
+            chunk.metadata["chunk_index"] = index
+            original = self._find_or_add(chunk.page_content, index)
+            if original is None:
+                result.append(chunk)
+                continue
+            self.stats.duplicates += 1
+            self.stats.duplicate_tokens += chunk.metadata.get("token_count", 0)
+            if self.mode == FOLD:
+                chunk.metadata["duplicate_of"] = original
+                result.append(chunk)
+        return result
+
+    def _find_or_add(self, text: str, index: int) -> Optional[int]:
+        # Folded chunks are re-expanded verbatim, so case must match there too.
+        normalized = fold_text(text) if self.mode == DROP else " ".join(text.split())
+        key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        if key in self._exact:
+            return self._exact[key]
+        if self.mode == DROP:
+            fingerprint, numbers = simhash(text), numbers_key(text)
+            n = len(self._indexes)
+            if n:
+                # A changed figure is a different chunk, however similar the wording.
+                distances = np.bitwise_count(self._fingerprints[:n] ^ fingerprint)
+                distances[self._numbers[:n] != numbers] = 64
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.max_distance:
+                    return self._indexes[nearest]
+            if n == len(self._fingerprints):
+                self._fingerprints = np.concatenate((self._fingerprints, np.zeros(n, dtype=np.uint64)))
+                self._numbers = np.concatenate((self._numbers, np.zeros(n, dtype=np.uint64)))
+            self._fingerprints[n] = fingerprint
+            self._numbers[n] = numbers
+            self._indexes.append(index)
+        self._exact[key] = index
+        return None
+
+
+# ---------------------------------------
+# ✅ Savings report
+# ---------------------------------------
+class DedupReport:
+    """Totals per chunk profile plus the most recent per-document results."""
+
+    def __init__(self, recent: int = 50):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._recent = deque(maxlen=recent)
+
+    def record(self, profile: str, stats: DedupStats) -> dict:
+        data = stats.to_dict(profile)
+        with self._lock:
+            totals = self._totals.setdefault(profile, {})
+            for name, value in data.items():
+                totals[name] = totals.get(name, 0) + value
+            # No source: blob URLs and paths carry users' file names.
+            self._recent.append({"profile": profile, **data})
+        return data
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"totals": {k: dict(v) for k, v in self._totals.items()}, "recent": list(self._recent)}
+
+
+dedup_report = DedupReport()
+metrics.register("dedup", dedup_report.snapshot)
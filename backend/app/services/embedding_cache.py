@@ -0,0 +1,90 @@
+# app/services/embedding_cache.py
+
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.sqlite_lru import SQLiteLRUStore
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Embedding cache settings
+# ---------------------------------------
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("embedding_cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))  # 512 MiB
+# Check the byte budget every N batch writes rather than on every one.
+EVICT_EVERY = 16
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    On-disk chunk embeddings keyed by (embedding model id, hash of the
+    whitespace-normalized text). Vectors are stored as float16 blobs in
+    SQLite and evicted least-recently-used once over `max_bytes`.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._store = SQLiteLRUStore(
+            path, "embeddings", max_bytes, value_column="vector",
+            evict_every=EVICT_EVERY, evict_batch=1024, label="embedding cache",
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(model_id: str, text: str) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, model_id: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached float32 vectors for `texts`, None where missing."""
+        keys = [self.key_for(model_id, text) for text in texts]
+        found: Dict[str, bytes] = {}
+        try:
+            found = self._store.get_many(keys)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Embedding cache read failed: {e}")
+
+        vectors = [
+            np.frombuffer(found[key], dtype=np.float16).astype(np.float32) if key in found else None
+            for key in keys
+        ]
+        hits = sum(1 for v in vectors if v is not None)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model_id: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        items = [
+            (self.key_for(model_id, text), np.asarray(vector, dtype=np.float16).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        try:
+            self._store.put_many(items)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {**self._store.stats(), "hits": hits, "misses": misses}
+
+
+embedding_cache = EmbeddingCache()
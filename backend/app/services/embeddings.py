@@ -0,0 +1,245 @@
+# app/services/embeddings.py
+
+import os
+import time
+import logging
+import threading
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.services import metrics
+from app.services.embedding_cache import EmbeddingCache, embedding_cache, normalize_text
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Embedding backend settings
+# ---------------------------------------
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# torch: full-precision PyTorch (default)
+# int8:  PyTorch with dynamically quantized int8 Linear layers (no extra dependencies)
+# onnx:  ONNX Runtime; needs `pip install "optimum[onnxruntime]"` (not in requirements.txt)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# ONNX export inside the model repo; the qint8 variants are pre-quantized.
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", str(os.cpu_count() or 1)))
+# Non-default backends must reproduce the PyTorch vectors at least this closely
+# (minimum cosine similarity over a probe set), otherwise we fall back to torch.
+EMBED_PARITY_CHECK = os.getenv("EMBED_PARITY_CHECK", "1") == "1"
+EMBED_PARITY_MIN_COSINE = float(os.getenv("EMBED_PARITY_MIN_COSINE", "0.98"))
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+_PARITY_PROBES = [
+    "The patient was prescribed 20 mg of atorvastatin once daily.",
+    "Total amount due: $1,284.50, payable within 30 days of the invoice date.",
+    "The court held that the contract was void for lack of consideration.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Quarterly revenue grew 12% year over year, driven by subscription sales.",
+    "Return policy: items may be returned unopened within 14 days.",
+    "Der Vertrag tritt am ersten Januar in Kraft.",
+    "ok",
+]
+
+
+# ---------------------------------------
+# ✅ Model loading per backend
+# ---------------------------------------
+class BackendUnavailableError(RuntimeError):
+    """The selected backend's optional dependencies are not installed."""
+
+
+def _load_torch() -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+
+
+def _load_int8() -> "SentenceTransformer":
+    import torch
+
+    model = _load_torch()
+    torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def _load_onnx() -> "SentenceTransformer":
+    missing = [name for name in ("optimum", "onnxruntime") if find_spec(name) is None]
+    if missing:
+        raise BackendUnavailableError(
+            f"EMBEDDING_BACKEND=onnx needs {' and '.join(missing)}, which requirements.txt does not "
+            'install: pip install "optimum[onnxruntime]", or unset EMBEDDING_BACKEND'
+        )
+    import onnxruntime as ort
+    from sentence_transformers import SentenceTransformer
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = EMBED_THREADS
+    options.inter_op_num_threads = 1
+    return SentenceTransformer(
+        EMBEDDING_MODEL,
+        device="cpu",
+        backend="onnx",
+        model_kwargs={
+            "file_name": EMBEDDING_ONNX_FILE,
+            "provider": "CPUExecutionProvider",
+            "session_options": options,
+        },
+    )
+
+
+_LOADERS = {"torch": _load_torch, "int8": _load_int8, "onnx": _load_onnx}
+
+
+def parity(candidate: "SentenceTransformer", reference: "SentenceTransformer") -> float:
+    """Minimum cosine similarity between two models' vectors over the probe set."""
+    a = candidate.encode(_PARITY_PROBES, convert_to_numpy=True, normalize_embeddings=True)
+    b = reference.encode(_PARITY_PROBES, convert_to_numpy=True, normalize_embeddings=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+
+# ---------------------------------------
+# ✅ LangChain embeddings wrapper
+# ---------------------------------------
+class SentenceEmbeddings(Embeddings):
+    """
+    LangChain `Embeddings` over a SentenceTransformer of any backend, with a
+    fixed batch size and per-call latency stats. Vectors are not normalized,
+    matching the HuggingFaceEmbeddings indexes built before.
+    """
+
+    def __init__(self, model: "SentenceTransformer", backend: str, batch_size: int = EMBED_BATCH_SIZE):
+        self.model = model
+        self.backend = backend
+        self.batch_size = batch_size
+        self.model_id = f"{EMBEDDING_MODEL}@{backend}"
+        self._lock = threading.Lock()
+        self._texts = 0
+        self._batch_latency = metrics.LatencyStat()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        started = time.perf_counter()
+        vectors = self.model.encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        self._batch_latency.record(time.perf_counter() - started)
+        with self._lock:
+            self._texts += len(texts)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode([t.replace("\n", " ") for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text.replace("\n", " ")])[0].tolist()
+
+    def stats(self) -> dict:
+        with self._lock:
+            texts = self._texts
+        return {
+            "model": EMBEDDING_MODEL,
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "threads": EMBED_THREADS,
+            "texts": texts,
+            "call_latency": self._batch_latency.snapshot(),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Document embeddings served from the persistent embedding cache; only
+    texts not seen before (for this model and backend) reach the model.
+    Queries are always embedded fresh.
+    """
+
+    def __init__(self, inner: SentenceEmbeddings, cache: EmbeddingCache = embedding_cache):
+        self.inner = inner
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.cache.get_many(self.inner.model_id, texts)
+        missing: Dict[str, List[int]] = {}
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            if vector is None:
+                missing.setdefault(normalize_text(text), []).append(i)
+        if missing:
+            fresh_texts = [texts[positions[0]] for positions in missing.values()]
+            fresh = self.inner.embed_documents(fresh_texts)
+            self.cache.put_many(self.inner.model_id, fresh_texts, fresh)
+            for positions, vector in zip(missing.values(), fresh):
+                for i in positions:
+                    vectors[i] = vector
+        return [v.tolist() if isinstance(v, np.ndarray) else v for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "cache": self.cache.stats()}
+
+
+def load_model(
+    backend: str, loaders: Mapping[str, Callable[[], "SentenceTransformer"]] = _LOADERS
+) -> Tuple["SentenceTransformer", str]:
+    """
+    The model for `backend` and the backend actually used. A non-default
+    backend that fails to load or fails the parity check against PyTorch
+    falls back to the PyTorch model. A missing optional dependency is a
+    configuration error and is raised rather than papered over.
+    """
+    if backend == "torch":
+        return loaders["torch"](), "torch"
+    try:
+        model = loaders[backend]()
+        if EMBED_PARITY_CHECK:
+            reference = loaders["torch"]()
+            score = parity(model, reference)
+            if score < EMBED_PARITY_MIN_COSINE:
+                logger.warning(
+                    f"⚠️ {backend} embeddings failed parity (min cosine {score:.4f} < "
+                    f"{EMBED_PARITY_MIN_COSINE}), using torch"
+                )
+                return reference, "torch"
+            logger.info(f"✅ {backend} embeddings pass parity (min cosine {score:.4f})")
+            del reference
+        return model, backend
+    except BackendUnavailableError:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load {backend} embedding backend ({e}), using torch")
+        return loaders["torch"](), "torch"
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> Embeddings:
+    """
+    The process-wide embedding model for EMBEDDING_BACKEND (see `load_model`),
+    behind the persistent embedding cache unless EMBEDDING_CACHE=0.
+    """
+    import torch
+
+    torch.set_num_threads(EMBED_THREADS)
+    backend = EMBEDDING_BACKEND if EMBEDDING_BACKEND in _LOADERS else "torch"
+    if backend != EMBEDDING_BACKEND:
+        logger.warning(f"⚠️ Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}', using torch")
+
+    model, backend = load_model(backend)
+    logger.info(f"🧮 Embeddings: {EMBEDDING_MODEL} on {backend}, batch {EMBED_BATCH_SIZE}, {EMBED_THREADS} threads")
+
+    embeddings = SentenceEmbeddings(model, backend)
+    if EMBEDDING_CACHE:
+        embeddings = CachedEmbeddings(embeddings)
+    metrics.register("embeddings", embeddings.stats)
+    return embeddings
@@ -0,0 +1,168 @@
+# app/services/extraction.py
+
+import os
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Extraction settings
+# ---------------------------------------
+# Number of worker processes used for large PDFs, and the page count from
+# which the pool is used at all (below it, process start-up costs more than
+# it saves and the single-threaded path wins).
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# Page ranges handed out per worker; more ranges than workers keeps the pool
+# balanced when some pages are much heavier than others.
+RANGES_PER_WORKER = 4
+# Pages per batch on the single-process path, so streaming consumers can
+# start chunking before the last page is extracted.
+PAGE_BATCH_SIZE = 32
+
+# Per-page OCR heuristic: a page is sent to OCR when its text layer is
+# (almost) empty, or when images cover most of the page and only a thin
+# text layer sits on top (stamps, scanner headers, page numbers).
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "25"))
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.6"))
+OCR_SPARSE_TEXT_CHARS = int(os.getenv("OCR_SPARSE_TEXT_CHARS", "200"))
+
+# Bump when extraction output changes so cached parses are invalidated.
+PARSER_VERSION = "2"
+
+PdfSource = Union[str, bytes]
+
+
+@dataclass
+class PageText:
+    """Text of a single PDF page (page_number is 1-based)."""
+    page_number: int
+    text: str
+    needs_ocr: bool = False
+    ocr: bool = False
+
+
+# ---------------------------------------
+# ✅ Worker process side
+# ---------------------------------------
+_worker_doc = None
+
+
+def _open_pdf(source: PdfSource) -> fitz.Document:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    # The format is sniffed upstream; don't let fitz guess from the extension.
+    return fitz.open(source, filetype="pdf")
+
+
+def _init_worker(source: PdfSource) -> None:
+    """Open the document once per worker process."""
+    global _worker_doc
+    _worker_doc = _open_pdf(source)
+
+
+def _image_coverage(page: fitz.Page) -> float:
+    """Fraction of the page area covered by images (capped at 1.0)."""
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & page.rect)
+    return min(1.0, covered / area)
+
+
+def page_needs_ocr(page: fitz.Page, text: str) -> bool:
+    """Cheap per-page decision: OCR only pages without a usable text layer."""
+    chars = len(text.strip())
+    if chars < OCR_MIN_TEXT_CHARS:
+        return True
+    if chars < OCR_SPARSE_TEXT_CHARS:
+        return _image_coverage(page) >= OCR_IMAGE_COVERAGE
+    return False
+
+
+def _extract_page(page: fitz.Page) -> Tuple[int, str, bool]:
+    text = page.get_text()
+    return page.number + 1, text, page_needs_ocr(page, text)
+
+
+def _extract_range(start: int, stop: int) -> List[Tuple[int, str, bool]]:
+    return [_extract_page(_worker_doc[i]) for i in range(start, stop)]
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = max(1, -(-page_count // parts))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+# ---------------------------------------
+# ✅ Public API
+# ---------------------------------------
+def iter_pages(
+    source: PdfSource,
+    workers: Optional[int] = None,
+    min_parallel_pages: Optional[int] = None,
+) -> Iterator[List[PageText]]:
+    """
+    Extract the text layer of every page, yielded in page order as batches.
+
+    `source` is a local path or the raw PDF bytes. Documents with at least
+    `min_parallel_pages` pages are split into page ranges across a process
+    pool; each worker opens the document on its own, and only a few ranges
+    are outstanding at a time. Pages without a usable text layer come back
+    with `needs_ocr=True`.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    threshold = PDF_PARALLEL_MIN_PAGES if min_parallel_pages is None else min_parallel_pages
+
+    doc = _open_pdf(source)
+    try:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < max(threshold, 2):
+            for start, stop in _page_ranges(page_count, -(-page_count // PAGE_BATCH_SIZE) or 1):
+                yield [PageText(*_extract_page(doc[i])) for i in range(start, stop)]
+            return
+    finally:
+        doc.close()
+
+    workers = min(workers, page_count)
+    ranges = _page_ranges(page_count, workers * RANGES_PER_WORKER)
+    logger.info(f"📑 Extracting {page_count} pages with {workers} workers ({len(ranges)} ranges)")
+
+    # "spawn" keeps the workers free of the parent's OCR/torch threads.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(source,),
+    ) as pool:
+        pending: Deque[Future] = deque()
+        try:
+            for start, stop in ranges:
+                pending.append(pool.submit(_extract_range, start, stop))
+                if len(pending) >= workers * 2:
+                    yield [PageText(*page) for page in pending.popleft().result()]
+            while pending:
+                yield [PageText(*page) for page in pending.popleft().result()]
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def extract_pages(
+    source: PdfSource,
+    workers: Optional[int] = None,
+    min_parallel_pages: Optional[int] = None,
+) -> List[PageText]:
+    """Text layer of every page, in page order (see `iter_pages`)."""
+    return [page for batch in iter_pages(source, workers, min_parallel_pages) for page in batch]
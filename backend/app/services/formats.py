@@ -0,0 +1,85 @@
+# app/services/formats.py
+
+import io
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Union
+
+# ---------------------------------------
+# ✅ Format detection by magic bytes
+# ---------------------------------------
+PDF = "pdf"
+DOCX = "docx"
+IMAGE = "image"
+
+SNIFF_BYTES = 1024
+
+
+@dataclass(frozen=True)
+class DocumentFormat:
+    kind: str          # pdf | docx | image
+    content_type: str
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"BM", "image/bmp"),
+)
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _is_docx(f: BinaryIO) -> bool:
+    """A ZIP container with a word/ part (OOXML word-processing document)."""
+    try:
+        with zipfile.ZipFile(f) as archive:
+            return any(name.startswith("word/") for name in archive.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def _detect(f: BinaryIO) -> Optional[DocumentFormat]:
+    head = f.read(SNIFF_BYTES)
+    if head.startswith(b"%PDF-"):
+        return DocumentFormat(PDF, "application/pdf")
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return DocumentFormat(IMAGE, "image/webp")
+    for signature, content_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return DocumentFormat(IMAGE, content_type)
+    if head.startswith(b"PK\x03\x04"):
+        f.seek(0)
+        return DocumentFormat(DOCX, DOCX_CONTENT_TYPE) if _is_docx(f) else None
+    # Some generators put junk before the header; PDF readers allow 1 KiB.
+    if b"%PDF-" in head:
+        return DocumentFormat(PDF, "application/pdf")
+    return None
+
+
+def detect_format(source: Union[str, bytes, BinaryIO]) -> DocumentFormat:
+    """
+    Format of a document from its leading bytes, never its file name.
+    `source` is a path, raw bytes, or a seekable binary file (rewound after).
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            fmt = _detect(f)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        fmt = _detect(io.BytesIO(source))
+    else:
+        try:
+            fmt = _detect(source)
+        finally:
+            source.seek(0)
+    if fmt is None:
+        raise UnsupportedFormatError("Unsupported file type: expected PDF, DOCX or an image (PNG, JPEG, GIF, TIFF, BMP, WEBP).")
+    return fmt
@@ -0,0 +1,111 @@
+# app/services/ingestion.py
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.services.rag import get_vectorstore_path, load_or_build_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Ingestion settings
+# ---------------------------------------
+# Parse/OCR/embedding is CPU heavy; a small fixed pool keeps a burst of
+# uploads from starving interactive chat on the same worker.
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "1"))
+INGEST_MAX_TRACKED_JOBS = int(os.getenv("INGEST_MAX_TRACKED_JOBS", "1000"))
+
+QUEUED = "queued"
+PARSING = "parsing"
+EMBEDDING = "embedding"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class IngestJob:
+    doc_id: int
+    user_id: str
+    file_path: str
+    content_hash: Optional[str] = None
+    status: str = QUEUED
+    error: Optional[str] = None
+    queued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "doc_id": self.doc_id,
+            "status": self.status,
+            "error": self.error,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueue:
+    """
+    Background parse → chunk → embed → index jobs, started at upload time.
+    Status is tracked per document id for the most recent jobs.
+    """
+
+    def __init__(self, max_workers: int = INGEST_MAX_WORKERS, max_tracked: int = INGEST_MAX_TRACKED_JOBS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[int, IngestJob]" = OrderedDict()
+        self._max_tracked = max_tracked
+        self._lock = threading.Lock()
+
+    def submit(self, doc_id: int, user_id: str, file_path: str, content_hash: Optional[str] = None) -> IngestJob:
+        with self._lock:
+            job = self._jobs.get(doc_id)
+            if job and job.status not in (READY, FAILED):
+                return job
+            job = IngestJob(doc_id=doc_id, user_id=user_id, file_path=file_path, content_hash=content_hash)
+            index_folder = get_vectorstore_path(user_id, file_path, content_hash)
+            if os.path.exists(os.path.join(index_folder, "index.faiss")):
+                job.status = READY
+                job.finished_at = job.queued_at
+            self._track(job)
+
+        if job.status == QUEUED:
+            logger.info(f"📥 Queued ingestion for document {doc_id}")
+            self._pool.submit(self._run, job)
+        return job
+
+    def get(self, doc_id: int) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(doc_id)
+
+    def _track(self, job: IngestJob) -> None:
+        self._jobs[job.doc_id] = job
+        self._jobs.move_to_end(job.doc_id)
+        while len(self._jobs) > self._max_tracked:
+            self._jobs.popitem(last=False)
+
+    def _run(self, job: IngestJob) -> None:
+        job.started_at = time.time()
+
+        def on_stage(stage: str) -> None:
+            job.status = stage
+
+        try:
+            load_or_build_vectorstore(job.user_id, job.file_path, on_stage=on_stage, content_hash=job.content_hash)
+            job.status = READY
+            logger.info(f"✅ Document {job.doc_id} ingested in {time.time() - job.started_at:.1f}s")
+        except Exception as e:
+            logger.exception(f"❌ Ingestion failed for document {job.doc_id}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+
+ingestion_queue = IngestionQueue()
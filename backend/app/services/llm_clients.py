@@ -0,0 +1,189 @@
+# app/services/llm_clients.py
+
+import os
+import logging
+import threading
+from typing import Dict, Tuple
+
+import httpx
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ LLM HTTP client settings
+# ---------------------------------------
+# HTTP/2 multiplexes concurrent requests over one connection; needs the `h2` package.
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+# Every client talks to a single host (the Groq API), so these limits are its per-host pool size.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))  # seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "10"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+
+ClientKey = Tuple[str, bool]  # (model, streaming)
+
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ LLM_HTTP2=1 but the h2 package is missing, using HTTP/1.1 keep-alive")
+        return False
+    return True
+
+
+class ConnectionStats:
+    """
+    Requests vs. new connections and TLS handshakes, fed by httpcore's
+    `trace` extension. Reuse ratio is the share of requests that did not
+    open a connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    def request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def event(self, name: str) -> None:
+        with self._lock:
+            if name == "connection.connect_tcp.complete":
+                self.connections += 1
+            elif name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+            elif name == "http2.send_request_headers.started":
+                self.http2_requests += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(self.requests - self.connections, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections,
+                "tls_handshakes": self.tls_handshakes,
+                "http2_requests": self.http2_requests,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+class _TracedTransport(httpx.HTTPTransport):
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.request()
+        request.extensions["trace"] = lambda name, info: self._stats.event(name)
+        return super().handle_request(request)
+
+
+class _AsyncTracedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.request()
+
+        async def trace(name, info):
+            self._stats.event(name)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+
+class LLMClientRegistry:
+    """
+    One long-lived sync and one async httpx client per (model, streaming)
+    configuration, shared by every ChatGroq built for it so connections
+    and TLS sessions survive across requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync: Dict[ClientKey, httpx.Client] = {}
+        self._async: Dict[ClientKey, httpx.AsyncClient] = {}
+        self._stats: Dict[ClientKey, ConnectionStats] = {}
+        self._http2 = None
+
+    def _options(self) -> dict:
+        if self._http2 is None:
+            self._http2 = _http2_available()
+        return {
+            "http2": self._http2,
+            "limits": httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        }
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=LLM_CONNECT_TIMEOUT, read=LLM_READ_TIMEOUT, write=LLM_WRITE_TIMEOUT, pool=LLM_POOL_TIMEOUT
+        )
+
+    def _stats_for(self, key: ClientKey) -> ConnectionStats:
+        return self._stats.setdefault(key, ConnectionStats())
+
+    def sync_client(self, model: str, streaming: bool = False) -> httpx.Client:
+        key = (model, streaming)
+        with self._lock:
+            client = self._sync.get(key)
+            if client is None:
+                transport = _TracedTransport(self._stats_for(key), **self._options())
+                client = httpx.Client(transport=transport, timeout=self._timeout())
+                self._sync[key] = client
+                logger.info(f"🔌 LLM HTTP client ready: {model} (streaming={streaming}, http2={self._http2})")
+            return client
+
+    def async_client(self, model: str, streaming: bool = False) -> httpx.AsyncClient:
+        key = (model, streaming)
+        with self._lock:
+            client = self._async.get(key)
+            if client is None:
+                transport = _AsyncTracedTransport(self._stats_for(key), **self._options())
+                client = httpx.AsyncClient(transport=transport, timeout=self._timeout())
+                self._async[key] = client
+            return client
+
+    async def aclose(self) -> None:
+        """Close every client and its pooled connections; run on the app's event loop at shutdown."""
+        with self._lock:
+            sync_clients, async_clients = list(self._sync.values()), list(self._async.values())
+            self._sync.clear()
+            self._async.clear()
+        for client in sync_clients:
+            client.close()
+        for client in async_clients:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            items = list(self._stats.items())
+            http2 = self._http2
+        return {
+            "http2": bool(http2),
+            "max_connections": LLM_MAX_CONNECTIONS,
+            "max_keepalive": LLM_MAX_KEEPALIVE,
+            "clients": {
+                f"{model}{' (stream)' if streaming else ''}": stats.snapshot()
+                for (model, streaming), stats in items
+            },
+        }
+
+
+llm_clients = LLMClientRegistry()
+metrics.register("llm_clients", llm_clients.stats)
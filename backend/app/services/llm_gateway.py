@@ -0,0 +1,390 @@
+# app/services/llm_gateway.py
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from groq import APIConnectionError, APIStatusError
+
+from app.services import metrics
+from app.services.chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ LLM gateway settings
+# ---------------------------------------
+# Per-model quota; the defaults are Groq's free-tier limits, raise them for paid plans.
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("LLM_TPM", "6000"))
+# Per-model overrides: "llama3-70b-8192=30:6000,llama-3.1-8b-instant=30:20000" (rpm:tpm)
+LLM_LIMITS = os.getenv("LLM_LIMITS", "")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # seconds, doubled per attempt
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Expected completion size, charged up front and corrected from the reported usage.
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "512"))
+# Charge for calls whose prompt is assembled inside a chain (retrieved context + history + answer).
+LLM_CHAIN_TOKENS_ESTIMATE = int(os.getenv("LLM_CHAIN_TOKENS_ESTIMATE", "2000"))
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # chat
+    BATCH = 10       # summarize / translate / extract
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, quota = item.rsplit("=", 1)
+            rpm, tpm = quota.split(":")
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring malformed LLM_LIMITS entry '{item}'")
+    return limits
+
+
+# ---------------------------------------
+# ✅ Rate limits
+# ---------------------------------------
+class TokenBucket:
+    """Refills continuously to `per_minute`; may go negative when usage is reconciled."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(per_minute, 1))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelLimits:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0  # set from Retry-After on 429
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def take(self, tokens: int, now: float) -> None:
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "model", "tokens", "enqueued", "event", "loop", "future", "granted")
+
+    def __init__(self, priority: int, seq: int, model: str, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def model_of(llm: Any) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or "default"
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    return None
+
+
+# ---------------------------------------
+# ✅ Gateway
+# ---------------------------------------
+class LLMGateway:
+    """
+    Single admission point for LLM calls. A call waits until its model's
+    request and token buckets have room and a concurrency slot is free;
+    waiting calls are admitted by priority, then arrival. Rate-limit and
+    server errors are retried with exponential backoff, honouring
+    Retry-After. Usable from sync (`invoke`, `call`, `slot`) and async
+    (`ainvoke`, `acall`, `aslot`) code; every entry point takes an explicit
+    priority, so no caller lands in the wrong lane by default.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._overrides = _parse_limits(LLM_LIMITS) if limits is None else limits
+        self._limits: Dict[str, ModelLimits] = {}
+        self._queue: List[_Waiter] = []
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._active = 0
+        self._dispatcher: Optional[threading.Thread] = None
+        self._calls = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._server_errors = 0
+        self._queue_wait = {p.name.lower(): metrics.LatencyStat() for p in Priority}
+
+    # ---------- scheduling ----------
+    def _limits_for(self, model: str) -> ModelLimits:
+        limits = self._limits.get(model)
+        if limits is None:
+            limits = self._limits[model] = ModelLimits(*self._overrides.get(model, (LLM_RPM, LLM_TPM)))
+        return limits
+
+    def _dispatch(self) -> Optional[float]:
+        """Admit every waiter that fits; returns seconds until the next bucket refill matters."""
+        now = time.monotonic()
+        next_wake: Optional[float] = None
+        blocked = set()
+        waiting = []
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if self._active >= self.max_concurrency or waiter.model in blocked:
+                waiting.append(waiter)
+                continue
+            limits = self._limits_for(waiter.model)
+            wait = limits.wait_time(waiter.tokens, now)
+            if wait > 0:
+                # Later waiters for this model must not overtake it.
+                blocked.add(waiter.model)
+                next_wake = wait if next_wake is None else min(next_wake, wait)
+                waiting.append(waiter)
+                continue
+            limits.take(waiter.tokens, now)
+            self._active += 1
+            waiter.granted = True
+            self._queue_wait[Priority(waiter.priority).name.lower()].record(now - waiter.enqueued)
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+        for waiter in waiting:
+            heapq.heappush(self._queue, waiter)
+        return next_wake
+
+    def _run(self) -> None:
+        with self._cond:
+            while True:
+                self._cond.wait(timeout=self._dispatch())
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._cond:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name="llm-gateway", daemon=True)
+                self._dispatcher.start()
+            heapq.heappush(self._queue, waiter)
+            self._cond.notify()
+
+    def _new_waiter(self, model: str, priority: Priority, tokens: int) -> _Waiter:
+        with self._cond:
+            self._seq += 1
+            return _Waiter(int(priority), self._seq, model, tokens)
+
+    def _acquire(self, model: str, priority: Priority, tokens: int) -> None:
+        waiter = self._new_waiter(model, priority, tokens)
+        waiter.event = threading.Event()
+        self._enqueue(waiter)
+        waiter.event.wait()
+
+    async def _aacquire(self, model: str, priority: Priority, tokens: int) -> None:
+        waiter = self._new_waiter(model, priority, tokens)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._cond:
+                if waiter.granted:
+                    self._active -= 1
+                else:
+                    self._queue.remove(waiter)
+                    heapq.heapify(self._queue)
+                self._cond.notify()
+            raise
+
+    def _release(self, model: str, estimated: int, actual: Optional[int] = None) -> None:
+        with self._cond:
+            self._active -= 1
+            if actual is not None:
+                self._limits_for(model).tokens.adjust(actual - estimated)
+            self._cond.notify()
+
+    # ---------- retries ----------
+    def _retry_delay(self, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None when `error` is not retryable."""
+        if isinstance(error, APIStatusError):
+            status = error.status_code
+            if status != 429 and status < 500:
+                return None
+        elif not isinstance(error, APIConnectionError):
+            return None
+
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        with self._cond:
+            self._retries += 1
+            if isinstance(error, APIStatusError) and error.status_code == 429:
+                self._rate_limited += 1
+                try:
+                    delay = max(delay, float(error.response.headers.get("retry-after", 0)))
+                except (TypeError, ValueError):
+                    pass
+                # Hold back every queued call for this model, not just this one.
+                self._limits_for(model).paused_until = time.monotonic() + delay
+            elif isinstance(error, APIStatusError):
+                self._server_errors += 1
+        logger.warning(f"🔁 {model} call failed ({error.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    # ---------- public API ----------
+    def call(
+        self,
+        model: str,
+        fn: Callable[[], Any],
+        priority: Priority,
+        tokens: int = LLM_CHAIN_TOKENS_ESTIMATE
+    ) -> Any:
+        with self._cond:
+            self._calls += 1
+        for attempt in range(self.max_retries + 1):
+            self._acquire(model, priority, tokens)
+            actual = None
+            try:
+                result = fn()
+                actual = _usage_tokens(result)
+                return result
+            except Exception as e:
+                delay = self._retry_delay(model, e, attempt) if attempt < self.max_retries else None
+                if delay is None:
+                    raise
+            finally:
+                self._release(model, tokens, actual)
+            time.sleep(delay)
+
+    async def acall(
+        self,
+        model: str,
+        fn: Callable[[], Awaitable[Any]],
+        priority: Priority,
+        tokens: int = LLM_CHAIN_TOKENS_ESTIMATE
+    ) -> Any:
+        with self._cond:
+            self._calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(model, priority, tokens)
+            actual = None
+            try:
+                result = await fn()
+                actual = _usage_tokens(result)
+                return result
+            except Exception as e:
+                delay = self._retry_delay(model, e, attempt) if attempt < self.max_retries else None
+                if delay is None:
+                    raise
+            finally:
+                self._release(model, tokens, actual)
+            await asyncio.sleep(delay)
+
+    def invoke(self, llm: Any, prompt: str, priority: Priority,
+               output_tokens: int = LLM_OUTPUT_TOKENS_ESTIMATE) -> Any:
+        tokens = count_tokens(prompt) + output_tokens
+        return self.call(model_of(llm), lambda: llm.invoke(prompt), priority, tokens)
+
+    async def ainvoke(self, llm: Any, prompt: str, priority: Priority,
+                      output_tokens: int = LLM_OUTPUT_TOKENS_ESTIMATE) -> Any:
+        tokens = count_tokens(prompt) + output_tokens
+        return await self.acall(model_of(llm), lambda: llm.ainvoke(prompt), priority, tokens)
+
+    @contextmanager
+    def slot(self, model: str, priority: Priority, tokens: int = LLM_CHAIN_TOKENS_ESTIMATE):
+        """Admission only, no retries: for calls that cannot be repeated, e.g. once streaming has started."""
+        with self._cond:
+            self._calls += 1
+        self._acquire(model, priority, tokens)
+        try:
+            yield
+        finally:
+            self._release(model, tokens)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, priority: Priority, tokens: int = LLM_CHAIN_TOKENS_ESTIMATE):
+        with self._cond:
+            self._calls += 1
+        await self._aacquire(model, priority, tokens)
+        try:
+            yield
+        finally:
+            self._release(model, tokens)
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            models = {}
+            for model, limits in self._limits.items():
+                limits.tokens.wait_time(0, now)  # refill before reporting
+                limits.requests.wait_time(0, now)
+                models[model] = {
+                    "rpm": int(limits.requests.capacity),
+                    "tpm": int(limits.tokens.capacity),
+                    "requests_available": int(limits.requests.level),
+                    "tokens_available": int(limits.tokens.level),
+                    "paused_seconds": round(max(limits.paused_until - now, 0.0), 2),
+                }
+            data = {
+                "active": self._active,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "calls": self._calls,
+                "retries": self._retries,
+                "rate_limited": self._rate_limited,
+                "server_errors": self._server_errors,
+                "models": models,
+            }
+        data["queue_wait"] = {name: stat.snapshot() for name, stat in self._queue_wait.items()}
+        return data
+
+
+llm_gateway = LLMGateway()
+metrics.register("llm_gateway", llm_gateway.stats)
@@ -0,0 +1,295 @@
+# app/services/memory_store.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from langchain.memory import ConversationBufferMemory
+
+from app.services import metrics
+from app.services.chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Conversation memory settings
+# ---------------------------------------
+# lru:    in-process, lost on restart (default)
+# sqlite: on-disk file, shared by the workers of one host
+# redis:  any Redis-compatible server (REDIS_URL); needs the `redis` package
+CHAT_MEMORY_BACKEND = os.getenv("CHAT_MEMORY_BACKEND", "lru").lower()
+CHAT_MEMORY_TTL = int(os.getenv("CHAT_MEMORY_TTL", str(7 * 24 * 3600)))  # seconds since last turn
+CHAT_MEMORY_MAX_CONVERSATIONS = int(os.getenv("CHAT_MEMORY_MAX_CONVERSATIONS", "1000"))  # lru backend
+# Only the newest messages fitting this many tokens are kept and sent to the condense prompt.
+CHAT_MEMORY_MAX_TOKENS = int(os.getenv("CHAT_MEMORY_MAX_TOKENS", "1200"))
+CHAT_MEMORY_PATH = os.getenv("CHAT_MEMORY_PATH", os.path.join("chat_memory", "memory.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = "minddocs:memory:"
+
+Messages = List[dict]
+Trim = Callable[[Messages], Messages]
+
+
+def trim_to_budget(messages: Messages, max_tokens: int = CHAT_MEMORY_MAX_TOKENS) -> Messages:
+    """The newest messages whose content fits `max_tokens`; the last exchange is always kept."""
+    kept, total = [], 0
+    for message in reversed(messages):
+        total += count_tokens(str(message.get("data", {}).get("content", "")))
+        if total > max_tokens and len(kept) >= 2:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+
+# ---------------------------------------
+# ✅ Backends (serialized LangChain messages per conversation key)
+# ---------------------------------------
+# `append` is one atomic read-modify-write per backend, so concurrent turns of
+# a conversation (possibly in different workers) never lose each other's
+# messages. It returns the message counts before and after trimming.
+class LRUMemoryBackend:
+    def __init__(self, max_conversations: int = CHAT_MEMORY_MAX_CONVERSATIONS, ttl: int = CHAT_MEMORY_TTL):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, Messages]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+
+    def _load(self, key: str) -> Messages:
+        item = self._items.get(key)
+        if item is None:
+            return []
+        if time.time() - item[0] > self.ttl:
+            del self._items[key]
+            return []
+        self._items.move_to_end(key)
+        return list(item[1])
+
+    def load(self, key: str) -> Messages:
+        with self._lock:
+            return self._load(key)
+
+    def append(self, key: str, messages: Messages, trim: Trim) -> Tuple[int, int]:
+        with self._lock:
+            stored = self._load(key) + messages
+            kept = trim(stored)
+            self._items[key] = (time.time(), kept)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_conversations:
+                self._items.popitem(last=False)
+                self._evicted += 1
+        return len(stored), len(kept)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"conversations": len(self._items), "max_conversations": self.max_conversations,
+                    "evicted": self._evicted}
+
+
+class SQLiteMemoryBackend:
+    def __init__(self, path: str = CHAT_MEMORY_PATH, ttl: int = CHAT_MEMORY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._saves = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " key TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_conversations_updated ON conversations(updated_at)")
+            self._conn = conn
+        return self._conn
+
+    def load(self, key: str) -> Messages:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT messages FROM conversations WHERE key = ? AND updated_at > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def append(self, key: str, messages: Messages, trim: Trim) -> Tuple[int, int]:
+        with self._lock:
+            conn = self._connect()
+            # Takes the write lock before reading, so other processes wait for this turn.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT messages FROM conversations WHERE key = ? AND updated_at > ?",
+                    (key, time.time() - self.ttl),
+                ).fetchone()
+                stored = (json.loads(row[0]) if row else []) + messages
+                kept = trim(stored)
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversations (key, messages, updated_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(kept), time.time()),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._saves += 1
+            if self._saves % 100 == 0:
+                conn.execute("DELETE FROM conversations WHERE updated_at <= ?", (time.time() - self.ttl,))
+        return len(stored), len(kept)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM conversations WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._connect().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {"conversations": count, "path": self.path}
+
+
+class RedisMemoryBackend:
+    def __init__(self, url: str = REDIS_URL, ttl: int = CHAT_MEMORY_TTL, client=None):
+        import redis
+
+        self.ttl = ttl
+        self._client = client or redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._client.ping()
+
+    def load(self, key: str) -> Messages:
+        raw = self._client.get(REDIS_PREFIX + key)
+        return json.loads(raw) if raw else []
+
+    def append(self, key: str, messages: Messages, trim: Trim) -> Tuple[int, int]:
+        from redis import WatchError
+
+        name = REDIS_PREFIX + key
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic: the write fails if another turn changed the key meanwhile.
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    stored = (json.loads(raw) if raw else []) + messages
+                    kept = trim(stored)
+                    pipe.multi()
+                    pipe.set(name, json.dumps(kept), ex=self.ttl)
+                    pipe.execute()
+                    return len(stored), len(kept)
+                except WatchError:
+                    continue
+
+    def delete(self, key: str) -> None:
+        self._client.delete(REDIS_PREFIX + key)
+
+    def stats(self) -> dict:
+        return {"url": REDIS_URL.split("@")[-1]}
+
+
+_BACKENDS = {"lru": LRUMemoryBackend, "sqlite": SQLiteMemoryBackend, "redis": RedisMemoryBackend}
+
+
+# ---------------------------------------
+# ✅ Store + LangChain adapters
+# ---------------------------------------
+class MemoryStore:
+    """
+    Conversation histories in the configured backend. Every save trims the
+    history to the token budget, so neither the stored state nor the
+    condense-question prompt grows with the length of a conversation.
+    """
+
+    def __init__(self, backend, max_tokens: int = CHAT_MEMORY_MAX_TOKENS):
+        self.backend = backend
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._saves = 0
+        self._trimmed = 0
+
+    def load(self, key: str) -> List[BaseMessage]:
+        with self._lock:
+            self._loads += 1
+        return messages_from_dict(self.backend.load(key))
+
+    def append(self, key: str, messages: Sequence[BaseMessage]) -> None:
+        stored, kept = self.backend.append(
+            key, messages_to_dict(list(messages)), lambda stored: trim_to_budget(stored, self.max_tokens)
+        )
+        with self._lock:
+            self._saves += 1
+            self._trimmed += stored - kept
+
+    def clear(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def stats(self) -> dict:
+        try:
+            backend = self.backend.stats()
+        except Exception as e:
+            backend = {"error": str(e)}
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "max_tokens": self.max_tokens,
+                "loads": self._loads,
+                "saves": self._saves,
+                "messages_trimmed": self._trimmed,
+                **backend,
+            }
+
+
+class StoredChatMessageHistory(BaseChatMessageHistory):
+    """LangChain message history reading and writing one conversation of a MemoryStore."""
+
+    def __init__(self, store: MemoryStore, key: str):
+        self.store = store
+        self.key = key
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.store.load(self.key)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.key, messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.key)
+
+
+def _create_backend():
+    backend = CHAT_MEMORY_BACKEND if CHAT_MEMORY_BACKEND in _BACKENDS else "lru"
+    if backend != CHAT_MEMORY_BACKEND:
+        logger.warning(f"⚠️ Unknown CHAT_MEMORY_BACKEND '{CHAT_MEMORY_BACKEND}', using lru")
+    try:
+        return _BACKENDS[backend]()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not start {backend} chat memory ({e}), using lru")
+        return LRUMemoryBackend()
+
+
+memory_store = MemoryStore(_create_backend())
+metrics.register("chat_memory", memory_store.stats)
+
+
+def get_conversation_memory(key: str) -> ConversationBufferMemory:
+    """Chain memory for one conversation, backed by the shared memory store."""
+    return ConversationBufferMemory(
+        chat_memory=StoredChatMessageHistory(memory_store, key),
+        memory_key="chat_history",
+        return_messages=True,
+        output_key="answer",
+    )
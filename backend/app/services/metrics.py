@@ -0,0 +1,53 @@
+# app/services/metrics.py
+
+import threading
+from collections import deque
+from typing import Callable, Dict
+
+# ---------------------------------------
+# ✅ Lightweight in-process metrics
+# ---------------------------------------
+# Services register a snapshot function; GET /metrics returns all of them.
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, dict]:
+    return {name: provider() for name, provider in _providers.items()}
+
+
+class LatencyStat:
+    """Count/mean over the process lifetime, percentiles over the last `window` samples."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total
+
+        def pct(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 2) if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+        }
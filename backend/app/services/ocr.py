@@ -0,0 +1,295 @@
+# app/services/ocr.py
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from importlib.metadata import PackageNotFoundError, version
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from app.services import metrics
+from app.services.extraction import PdfSource
+from app.services.ocr_cache import OcrCache, ocr_cache
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ OCR settings
+# ---------------------------------------
+OCR_LANGS = [lang.strip() for lang in os.getenv("OCR_LANGS", "en").split(",") if lang.strip()]
+# 0 runs the recognizer in-process (no worker pool).
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+# Batches submitted but not finished; bounds rendered pages held in memory.
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", str(max(2, OCR_WORKERS * 2))))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "100"))
+# Longest rendered side; large-format pages get a lower DPI instead of huge bitmaps.
+OCR_MAX_SIDE_PX = int(os.getenv("OCR_MAX_SIDE_PX", "2200"))
+
+try:
+    _EASYOCR_VERSION = version("easyocr")
+except PackageNotFoundError:
+    _EASYOCR_VERSION = "unknown"
+
+# Part of the parser fingerprint: changing any of these changes OCR output.
+OCR_FINGERPRINT = f"easyocr-{_EASYOCR_VERSION}-{'+'.join(OCR_LANGS)}-{OCR_DPI}-{OCR_MIN_DPI}-{OCR_MAX_SIDE_PX}"
+
+
+# ---------------------------------------
+# ✅ Page rendering & preprocessing
+# ---------------------------------------
+def adaptive_dpi(width_pt: float, height_pt: float) -> int:
+    """OCR_DPI, lowered so the longest side stays within OCR_MAX_SIDE_PX."""
+    longest_in = max(width_pt, height_pt) / 72.0
+    if longest_in <= 0:
+        return OCR_DPI
+    return int(max(OCR_MIN_DPI, min(OCR_DPI, OCR_MAX_SIDE_PX / longest_in)))
+
+
+def preprocess(image: Image.Image) -> np.ndarray:
+    """Grayscale and downscale to OCR_MAX_SIDE_PX; returns a uint8 array."""
+    if image.mode != "L":
+        image = image.convert("L")
+    if max(image.size) > OCR_MAX_SIDE_PX:
+        image.thumbnail((OCR_MAX_SIDE_PX, OCR_MAX_SIDE_PX))
+    return np.asarray(image)
+
+
+def render_page(page: fitz.Page) -> Tuple[np.ndarray, fitz.Pixmap]:
+    """
+    Rasterize a page straight from the open document into a grayscale array.
+    The array is a view on the pixmap's samples (no copy); keep the returned
+    pixmap alive for as long as the array is used.
+    """
+    dpi = adaptive_dpi(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return image, pix
+
+
+# ---------------------------------------
+# ✅ Recognizer (worker process side)
+# ---------------------------------------
+_reader = None
+
+
+def _get_reader():
+    global _reader
+    if _reader is None:
+        import easyocr
+
+        _reader = easyocr.Reader(OCR_LANGS, gpu=False)
+    return _reader
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+
+    torch.set_num_threads(max(1, threads))
+    _get_reader()
+
+
+def _recognize(image: np.ndarray) -> Tuple[str, bool]:
+    """Recognized text of an image and whether it came from the OCR cache."""
+    cache_key = OcrCache.key_for(image, OCR_FINGERPRINT)
+    text = ocr_cache.get(cache_key)
+    if text is not None:
+        return text, True
+    text = "\n".join(_get_reader().readtext(image, detail=0, paragraph=True))
+    ocr_cache.put(cache_key, text)
+    return text, False
+
+
+def _recognize_batch(batch: List[Tuple[object, np.ndarray]]) -> List[Tuple[object, str, float, bool]]:
+    results = []
+    for key, image in batch:
+        started = time.perf_counter()
+        text, cached = _recognize(image)
+        results.append((key, text, time.perf_counter() - started, cached))
+    return results
+
+
+_worker_docs: Dict[Tuple[str, int, int, int], fitz.Document] = {}
+
+
+def _open_worker_doc(source: str) -> fitz.Document:
+    """
+    Per-worker open documents, so consecutive batches of one PDF share a
+    decode. Keyed by file identity as well as path: the blob cache replaces
+    a file in place when its ETag changes, and the new content must be read.
+    """
+    stat = os.stat(source)
+    key = (source, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    doc = _worker_docs.get(key)
+    if doc is None:
+        for stale in _worker_docs.values():
+            stale.close()
+        _worker_docs.clear()
+        doc = _worker_docs[key] = fitz.open(source, filetype="pdf")
+    return doc
+
+
+def _ocr_pages(doc: fitz.Document, page_numbers: List[int]) -> List[Tuple[int, str, float, bool]]:
+    results = []
+    for number in page_numbers:
+        started = time.perf_counter()
+        image, pix = render_page(doc[number - 1])
+        text, cached = _recognize(image)
+        del image, pix
+        results.append((number, text, time.perf_counter() - started, cached))
+    return results
+
+
+def _ocr_pdf_batch(source: str, page_numbers: List[int]) -> List[Tuple[int, str, float, bool]]:
+    return _ocr_pages(_open_worker_doc(source), page_numbers)
+
+
+# ---------------------------------------
+# ✅ OCR service
+# ---------------------------------------
+class OcrService:
+    """
+    OCR worker pool. Pages are grouped into batches and at most
+    `max_in_flight` batches are outstanding at once; each page is rendered
+    only when its batch runs, so memory stays bounded however many pages a
+    document has.
+    """
+
+    def __init__(self, workers: int = OCR_WORKERS, batch_size: int = OCR_BATCH_SIZE,
+                 max_in_flight: int = OCR_MAX_IN_FLIGHT):
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._pages = 0
+        self._in_flight_pages = 0
+        self._max_in_flight_pages = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._page_latency = metrics.LatencyStat()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(threads,),
+                )
+                logger.info(f"🔠 Started OCR pool: {self.workers} workers x {threads} threads")
+            return self._pool
+
+    def _track(self, pages_delta: int, results: List[Tuple[object, str, float, bool]] = ()) -> None:
+        hits = sum(1 for *_, cached in results if cached)
+        with self._stats_lock:
+            self._in_flight_pages += pages_delta
+            self._max_in_flight_pages = max(self._max_in_flight_pages, self._in_flight_pages)
+            self._pages += len(results)
+            self._cache_hits += hits
+            self._cache_misses += len(results) - hits
+        for _, _, seconds, cached in results:
+            if not cached:
+                self._page_latency.record(seconds)
+
+    def _batches(self, items: Iterable) -> Iterator[list]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _run(self, calls: Iterable[Tuple[Callable, tuple, int]], pool: Optional[ProcessPoolExecutor]) -> Dict[object, str]:
+        """Run (fn, args, pages) batch calls, at most `max_in_flight` at a time; returns {key: text}."""
+        texts: Dict[object, str] = {}
+
+        def collect(results: List[Tuple[object, str, float, bool]], size: int) -> None:
+            self._track(-size, results)
+            for key, text, _, _ in results:
+                texts[key] = text
+
+        if pool is None:
+            for fn, args, size in calls:
+                self._track(size)
+                collect(fn(*args), size)
+            return texts
+
+        pending: Dict[Future, int] = {}
+        try:
+            for fn, args, size in calls:
+                while len(pending) >= self.max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result(), pending.pop(future))
+                self._track(size)
+                pending[pool.submit(fn, *args)] = size
+            for future in list(pending):
+                collect(future.result(), pending.pop(future))
+        finally:
+            for future, size in pending.items():
+                future.cancel()
+                self._track(-size)
+        return texts
+
+    def recognize(self, images: Iterable[Tuple[object, np.ndarray]]) -> Dict[object, str]:
+        """OCR already-rendered (key, image) pairs; returns {key: text}."""
+        calls = ((_recognize_batch, (batch,), len(batch)) for batch in self._batches(images))
+        return self._run(calls, self._get_pool())
+
+    def ocr_pdf_pages(self, source: PdfSource, page_numbers: List[int]) -> Dict[int, str]:
+        """
+        OCR only the given 1-based pages of a PDF. Workers rasterize the pages
+        themselves from their own open fitz document, so no page image is
+        ever decoded twice or copied between processes.
+        """
+        numbers = sorted(set(page_numbers))
+        pool = self._get_pool()
+        if pool is not None and isinstance(source, str):
+            calls = ((_ocr_pdf_batch, (source, batch), len(batch)) for batch in self._batches(numbers))
+            return self._run(calls, pool)
+
+        is_bytes = isinstance(source, (bytes, bytearray))
+        doc = fitz.open(stream=source, filetype="pdf") if is_bytes else fitz.open(source, filetype="pdf")
+        try:
+            calls = ((_ocr_pages, (doc, batch), len(batch)) for batch in self._batches(numbers))
+            return self._run(calls, None)
+        finally:
+            doc.close()
+
+    def ocr_image(self, image: Image.Image) -> str:
+        return self.recognize([(0, preprocess(image))]).get(0, "")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            data = {
+                "workers": self.workers,
+                "batch_size": self.batch_size,
+                "max_in_flight_batches": self.max_in_flight,
+                "pages": self._pages,
+                "queue_depth_pages": self._in_flight_pages,
+                "max_queue_depth_pages": self._max_in_flight_pages,
+                "cache_hits": self._cache_hits,
+                "cache_misses": self._cache_misses,
+            }
+        data["page_latency"] = self._page_latency.snapshot()
+        data["cache"] = ocr_cache.stats()
+        return data
+
+
+ocr_service = OcrService()
+metrics.register("ocr", ocr_service.stats)
@@ -0,0 +1,65 @@
+# app/services/ocr_cache.py
+
+import os
+import zlib
+import sqlite3
+import hashlib
+import logging
+from typing import Optional
+
+import numpy as np
+
+from app.services.sqlite_lru import SQLiteLRUStore
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ OCR result cache settings
+# ---------------------------------------
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join("ocr_cache", "ocr_results.sqlite3"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))  # 256 MiB
+# Check the byte budget every N inserts rather than on every one.
+EVICT_EVERY = 64
+
+
+class OcrCache:
+    """
+    On-disk OCR results keyed by an exact hash of the rendered page image
+    plus the OCR settings. Text is stored zlib-compressed in SQLite (shared
+    safely by the OCR worker processes) and evicted least-recently-used.
+    """
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_bytes: int = OCR_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._store = SQLiteLRUStore(
+            path, "ocr_results", max_bytes, value_column="text",
+            evict_every=EVICT_EVERY, evict_batch=256, label="OCR cache",
+        )
+
+    @staticmethod
+    def key_for(image: np.ndarray, settings: str) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{settings}|{image.shape}|{image.dtype}".encode("utf-8"))
+        digest.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            blob = self._store.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ OCR cache read failed: {e}")
+            return None
+        return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+    def put(self, key: str, text: str) -> None:
+        try:
+            self._store.put(key, zlib.compress(text.encode("utf-8"), 6))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ OCR cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return self._store.stats()
+
+
+ocr_cache = OcrCache()
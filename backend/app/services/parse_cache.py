@@ -0,0 +1,197 @@
+# app/services/parse_cache.py
+
+import os
+import gzip
+import json
+import hashlib
+import logging
+import uuid
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.services.extraction import PageText, PdfSource
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Cache settings
+# ---------------------------------------
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "parse_cache")
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(1024 ** 3)))  # 1 GiB
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ParsedDocument:
+    """Per-page text of a document plus chunk boundaries per chunking profile."""
+    pages: List[PageText]
+    chunks: Dict[str, List[Tuple[int, ...]]] = field(default_factory=dict)
+
+
+def content_hash(source: PdfSource) -> str:
+    """SHA-256 of the source bytes; local files are hashed in blocks."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _sha1(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    """
+    Content-addressed, on-disk cache of parsed documents.
+
+    Entries are keyed by the content hash of the source bytes plus the parser
+    fingerprint and evicted least-recently-used once the directory exceeds
+    `max_bytes`. Aliases map a source (blob URL, local path) to an entry so a
+    repeated request can skip download and hashing altogether.
+    """
+
+    def __init__(self, root: str = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries_dir = os.path.join(root, "entries")
+        self._aliases_dir = os.path.join(root, "aliases")
+        self._lock = threading.Lock()
+        os.makedirs(self._entries_dir, exist_ok=True)
+        os.makedirs(self._aliases_dir, exist_ok=True)
+
+    # ---------- keys ----------
+    @staticmethod
+    def entry_key(source_hash: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{source_hash}:{fingerprint}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._entries_dir, f"{key}.json.gz")
+
+    def _alias_path(self, source_key: str) -> str:
+        return os.path.join(self._aliases_dir, _sha1(source_key))
+
+    # ---------- aliases ----------
+    def lookup_alias(self, source_key: str) -> Optional[str]:
+        try:
+            with open(self._alias_path(source_key), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def add_alias(self, source_key: str, key: str) -> None:
+        self._atomic_write(self._alias_path(source_key), key.encode("utf-8"))
+
+    # ---------- entries ----------
+    def get(self, key: str) -> Optional[ParsedDocument]:
+        path = self._entry_path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning(f"⚠️ Dropping unreadable parse cache entry {key}")
+            self._remove(path)
+            return None
+
+        os.utime(path)  # LRU: mtime is the last access time
+        return ParsedDocument(
+            pages=[PageText(n, text, False, bool(ocr)) for n, text, ocr in data["pages"]],
+            chunks={name: [tuple(b) for b in bounds] for name, bounds in data.get("chunks", {}).items()},
+        )
+
+    def put(self, key: str, parsed: ParsedDocument) -> None:
+        data = {
+            "pages": [[p.page_number, p.text, p.ocr] for p in parsed.pages],
+            "chunks": parsed.chunks,
+        }
+        payload = gzip.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), compresslevel=5)
+        self._atomic_write(self._entry_path(key), payload)
+        self._evict()
+
+    def writer(self, key: str) -> "ParseCacheWriter":
+        """Write an entry page batch by page batch instead of all at once."""
+        return ParseCacheWriter(self, key)
+
+    def put_chunks(self, key: str, profile: str, bounds: List[Tuple[int, ...]]) -> None:
+        """Record chunk boundaries for one profile on an existing entry."""
+        parsed = self.get(key)
+        if parsed is None:
+            return
+        parsed.chunks[profile] = list(bounds)
+        self.put(key, parsed)
+
+    # ---------- housekeeping ----------
+    def _atomic_write(self, path: str, payload: bytes) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for item in os.scandir(self._entries_dir):
+                if item.is_file() and item.name.endswith(".json.gz"):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total -= size
+                logger.info(f"🧹 Evicted parse cache entry {os.path.basename(path)}")
+                if total <= self.max_bytes:
+                    break
+
+
+class ParseCacheWriter:
+    """
+    Streams one entry to a temporary file as pages arrive, so a cold parse
+    never has to hold the whole document. The entry only becomes visible on
+    `commit`; `abort` (e.g. the consumer stopped early) discards it.
+    """
+
+    def __init__(self, cache: ParseCache, key: str):
+        self._cache = cache
+        self._path = cache._entry_path(key)
+        # Unique per writer: interleaved generators may share a thread.
+        self._tmp = f"{self._path}.{uuid.uuid4().hex}.tmp"
+        self._file = gzip.open(self._tmp, "wt", encoding="utf-8", compresslevel=5)
+        self._file.write('{"pages": [')
+        self._empty = True
+
+    def add_pages(self, pages: List[PageText]) -> None:
+        for page in pages:
+            if not self._empty:
+                self._file.write(",")
+            self._file.write(json.dumps([page.page_number, page.text, page.ocr], ensure_ascii=False))
+            self._empty = False
+
+    def commit(self, chunks: Dict[str, List[Tuple[int, ...]]]) -> None:
+        self._file.write(f'], "chunks": {json.dumps(chunks)}}}')
+        self._file.close()
+        os.replace(self._tmp, self._path)
+        self._cache._evict()
+
+    def abort(self) -> None:
+        self._file.close()
+        self._cache._remove(self._tmp)
+
+
+parse_cache = ParseCache()
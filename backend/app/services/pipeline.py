@@ -0,0 +1,82 @@
+# app/services/pipeline.py
+
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# ---------------------------------------
+# ✅ Streaming ingestion settings
+# ---------------------------------------
+# Queue sizes are in batches between stages: parse → chunk → embed.
+INGEST_PAGE_QUEUE = int(os.getenv("INGEST_PAGE_QUEUE", "4"))
+INGEST_CHUNK_QUEUE = int(os.getenv("INGEST_CHUNK_QUEUE", "8"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def iter_in_thread(items: Iterable[T], maxsize: int, name: str = "stage") -> Iterator[T]:
+    """
+    Run `items` in a background thread and yield its values through a
+    bounded queue. The producer blocks once `maxsize` values are waiting, so
+    a fast stage can only run that far ahead of a slow one. Exceptions are
+    re-raised in the consumer; closing the consumer stops the producer.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run() -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failed(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def rebatch(batches: Iterable[List[T]], size: int) -> Iterator[List[T]]:
+    """Regroup a stream of lists into lists of exactly `size` (the last may be shorter)."""
+    pending: List[T] = []
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= size:
+            yield pending[:size]
+            pending = pending[size:]
+    if pending:
+        yield pending
@@ -1,20 +1,29 @@
 import os
+import time
+import shutil
 import asyncio
 import logging
-from typing import Any, Optional, Dict
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
-from app.services.utils import load_and_chunk_pdf
+from app.services import metrics
+from app.services.chat_engine import REWRITE_MODEL, RetrievalChatEngine
+from app.services.embeddings import get_embeddings
+from app.services.pipeline import INGEST_CHUNK_QUEUE, INGEST_EMBED_BATCH, iter_in_thread, rebatch
+from app.services.llm_clients import llm_clients
+from app.services.memory_store import get_conversation_memory
+from app.services.sessions import ChatSession, SessionKey, chat_sessions
+from app.services.utils import iter_document_chunks
+from app.services.vectorstore_cache import VECTORSTORE_PRELOAD, recently_used_indexes, vectorstore_cache
 from app.utils.azure_blob_utils import get_blob_url_from_filename
 from sqlalchemy.exc import OperationalError
 from langchain_community.vectorstores import FAISS
-from langchain.memory import ConversationBufferMemory
+from langchain_core.embeddings import Embeddings
 from langchain.chains import ConversationalRetrievalChain
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain.embeddings import HuggingFaceEmbeddings  # ✅ Use this for preloaded model
 from langchain_groq import ChatGroq
-from sentence_transformers import SentenceTransformer  # ✅ Preload model
-from duckduckgo_search import DDGS
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -23,7 +32,7 @@ logger = logging.getLogger(__name__)
 VECTOR_FOLDER = "vectorstores"
 os.makedirs(VECTOR_FOLDER, exist_ok=True)
 
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+embeddings = get_embeddings()  # ✅ Preload model (backend from EMBEDDING_BACKEND)
 DEFAULT_GROQ_MODEL = "llama3-70b-8192"
 
 domain_prompts: Dict[str, str] = {
@@ -35,9 +44,13 @@ domain_prompts: Dict[str, str] = {
     "default": "You are a helpful assistant.",
 }
 
-user_memory: Dict[str, ConversationBufferMemory] = {}
-
-def get_llm_by_domain(domain: str, stream=False, handler=None) -> ChatGroq:
+def get_llm_by_domain(
+    domain: str,
+    stream=False,
+    handler=None,
+    model: str = DEFAULT_GROQ_MODEL,
+    temperature: float = 0.9
+) -> ChatGroq:
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise EnvironmentError("🔴 Missing GROQ_API_KEY in environment variables")
@@ -47,69 +60,175 @@ def get_llm_by_domain(domain: str, stream=False, handler=None) -> ChatGroq:
     logger.info(f"🔐 First 8 of key: {api_key[:8]}...")
 
     llm = ChatGroq(
-        model=DEFAULT_GROQ_MODEL,
+        model=model,
         api_key=api_key,
         base_url="https://api.groq.com",
-        temperature=0.9,
+        temperature=temperature,
         streaming=stream,
-        callbacks=[handler] if stream and handler else None
+        callbacks=[handler] if stream and handler else None,
+        # Retries and 429 back-off happen in the LLM gateway; SDK retries would stack on top.
+        max_retries=0,
+        # Pooled keep-alive clients shared by every ChatGroq of this model/mode.
+        http_client=llm_clients.sync_client(model, stream),
+        http_async_client=llm_clients.async_client(model, stream)
     )
     return llm
 
-def get_vectorstore_path(user_id: str, file_path: str) -> str:
-    fname = os.path.basename(file_path).replace(" ", "_").replace(".", "_")
+def get_vectorstore_path(user_id: str, file_path: str, content_hash: Optional[str] = None) -> str:
+    # Deduplicated uploads share one index per content hash; access control
+    # stays with the per-user Document rows that reference it.
+    if content_hash:
+        return os.path.join(VECTOR_FOLDER, f"sha256_{content_hash}")
+    fname = os.path.basename(urlparse(file_path).path).replace(".", "_").replace(" ", "_")
     return os.path.join(VECTOR_FOLDER, f"{user_id}_{fname}")
 
-def build_rag_chain(
-    user_id: str,
+_index_locks: Dict[str, threading.Lock] = {}
+_index_locks_guard = threading.Lock()
+
+def _index_lock(vs_folder: str) -> threading.Lock:
+    with _index_locks_guard:
+        return _index_locks.setdefault(vs_folder, threading.Lock())
+
+def _build_vectorstore_streaming(
     file_path: str,
-    domain: str,
-    stream: bool = False,
-    handler: Optional[BaseCallbackHandler] = None
-) -> ConversationalRetrievalChain:
-    try:
-        from urllib.parse import urlparse
-        logger.info(f"🔧 Building RAG chain for user: {user_id}, domain: {domain}, stream: {stream}")
+    embeddings: Embeddings,
+    on_stage: Optional[Callable[[str], None]] = None
+) -> FAISS:
+    """
+    Parse → chunk → embed → insert as a pipeline. Parsing/OCR and chunking
+    run in background stages behind bounded queues while this thread embeds
+    fixed-size batches and adds them to the index, so parse and embedding
+    overlap and only a few batches are ever held in memory.
+    """
+    chunk_batches = iter_in_thread(
+        iter_document_chunks(file_path, profile="retrieval"), INGEST_CHUNK_QUEUE, name="chunk"
+    )
+    vs: Optional[FAISS] = None
+    total = 0
+    for batch in rebatch(chunk_batches, INGEST_EMBED_BATCH):
+        if vs is None:
+            print("📃 First chunk preview:", batch[0].page_content[:300])
+            if on_stage:
+                on_stage("embedding")
+        texts = [doc.page_content for doc in batch]
+        vectors = embeddings.embed_documents(texts)
+        metadatas = [doc.metadata for doc in batch]
+        if vs is None:
+            vs = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+        else:
+            vs.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        total += len(batch)
 
-        embeddings = HuggingFaceEmbeddings(client=embedding_model)
-        blob_name = os.path.basename(urlparse(file_path).path).replace(".", "_").replace(" ", "_")
-        vs_folder = os.path.join(VECTOR_FOLDER, f"{user_id}_{blob_name}")
-        os.makedirs(vs_folder, exist_ok=True)
-        index_path = os.path.join(vs_folder, "index.faiss")
+    if vs is None:
+        print("❌ No chunks generated — document empty or OCR failed")
+        raise RuntimeError("❌ Document processing failed: ❗ No readable content found in document.")
+    logger.info(f"🧮 Indexed {total} chunks")
+    return vs
+
+def _load_vectorstore(vs_folder: str) -> FAISS:
+    logger.info(f"🔁 Loading FAISS index from {vs_folder}")
+    return FAISS.load_local(vs_folder, embeddings, allow_dangerous_deserialization=True)
+
+def load_or_build_vectorstore(
+    user_id: str,
+    file_path: str,
+    on_stage: Optional[Callable[[str], None]] = None,
+    content_hash: Optional[str] = None
+) -> FAISS:
+    """
+    Load the FAISS index of a document, building it first if needed.
+    Builds of the same index are serialized, so an upload-time ingestion job
+    and a first chat never embed the same document twice. Loaded indexes are
+    kept in the in-process vectorstore cache.
+    """
+    vs_folder = get_vectorstore_path(user_id, file_path, content_hash)
+    index_path = os.path.join(vs_folder, "index.faiss")
 
+    with _index_lock(vs_folder):
         if os.path.exists(index_path):
-            logger.info(f"🔁 Reloading FAISS index from {vs_folder}")
-            vs = FAISS.load_local(vs_folder, embeddings, allow_dangerous_deserialization=True)
-        else:
-            logger.info(f"⚙️ Creating FAISS index from blob: {file_path}")
-            docs = load_and_chunk_pdf(file_path)
-            if not docs:
-                print("❌ No chunks generated — document empty or OCR failed")
-            else:
-                print("📃 First chunk preview:", docs[0].page_content[:300])
-            vs = FAISS.from_documents(docs, embeddings)
-            vs.save_local(vs_folder)
-
-        retriever = vs.as_retriever()
-        mem_key = f"{user_id}:{file_path}"
-        memory = user_memory.get(mem_key)
-        if not memory:
-            logger.info(f"🧠 Creating memory buffer for: {mem_key}")
-            memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-            user_memory[mem_key] = memory
-
-        llm = get_llm_by_domain(domain, stream=stream, handler=handler)
-
-        chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
+            return vectorstore_cache.get(vs_folder, lambda: _load_vectorstore(vs_folder))
+
+        logger.info(f"⚙️ Creating FAISS index from blob: {file_path}")
+        if on_stage:
+            on_stage("parsing")
+        vs = _build_vectorstore_streaming(file_path, embeddings, on_stage)
+
+        # Save next to the target and rename, so readers never see half an index.
+        tmp_folder = f"{vs_folder}.tmp-{os.getpid()}"
+        vs.save_local(tmp_folder)
+        if os.path.isdir(vs_folder):
+            shutil.rmtree(vs_folder)
+        os.rename(tmp_folder, vs_folder)
+        vectorstore_cache.put(vs_folder, vs)
+        return vs
+
+def warm_vectorstores(limit: int = VECTORSTORE_PRELOAD) -> int:
+    """Load the most recently used indexes into the vectorstore cache."""
+    loaded = 0
+    for vs_folder in recently_used_indexes(VECTOR_FOLDER, limit):
+        if vectorstore_cache.resident_bytes >= vectorstore_cache.max_bytes:
+            break
+        try:
+            with _index_lock(vs_folder):
+                vectorstore_cache.get(vs_folder, lambda: _load_vectorstore(vs_folder))
+            loaded += 1
+        except Exception as e:
+            logger.warning(f"⚠️ Could not preload vectorstore {vs_folder}: {e}")
+    logger.info(f"🔥 Warmed {loaded} vectorstores")
+    return loaded
+
+def _new_chat_session(key: SessionKey, vs: FAISS, domain: str) -> ChatSession:
+    retriever = vs.as_retriever()
+    memory = get_conversation_memory(f"{key[0]}:{key[1]}")
+
+    llm = get_llm_by_domain(domain)
+    stream_llm = get_llm_by_domain(domain, stream=True)
+    # Follow-up rewrites go to a small, fast model; it never streams, so only
+    # answer tokens reach a stream handler.
+    rewrite_llm = get_llm_by_domain(domain, model=REWRITE_MODEL, temperature=0)
+
+    def chain_for(model: ChatGroq, retry_answer: bool) -> ConversationalRetrievalChain:
+        return RetrievalChatEngine.from_llm(
+            llm=model,
+            condense_question_llm=rewrite_llm,
             retriever=retriever,
             memory=memory,
             return_source_documents=True,
-            output_key="answer"
+            output_key="answer",
+            retry_answer=retry_answer
         )
-        chain.memory.output_key = "answer"
-        logger.info("✅ RAG chain built successfully")
-        return chain
+
+    return ChatSession(
+        key=key,
+        vectorstore=vs,
+        retriever=retriever,
+        memory=memory,
+        llm=llm,
+        stream_llm=stream_llm,
+        chain=chain_for(llm, retry_answer=True),
+        # Streamed tokens cannot be taken back, so a started stream is not retried.
+        stream_chain=chain_for(stream_llm, retry_answer=False),
+    )
+
+def get_chat_session(
+    user_id: str,
+    file_path: str,
+    domain: str,
+    content_hash: Optional[str] = None
+) -> ChatSession:
+    """
+    The cached chat session for (user, document, domain). Only the first
+    message builds the retriever, LLM clients and chains; follow-ups pay for
+    retrieval and generation only.
+    """
+    if not file_path.startswith("http"):
+        file_path = get_blob_url_from_filename(file_path)
+        print(f"🔗 Converted filename to blob URL: {file_path}")
+
+    try:
+        vs = load_or_build_vectorstore(user_id, file_path, content_hash=content_hash)
+        key = (str(user_id), file_path, domain.lower())
+        return chat_sessions.get(key, vs, lambda: _new_chat_session(key, vs, domain))
 
     except OperationalError as db_err:
         logger.exception("Database/faiss access issue")
@@ -121,51 +240,109 @@ def build_rag_chain(
         logger.exception("Unexpected error building RAG chain")
         raise RuntimeError("Unexpected error in building RAG chain") from exc
 
-def get_rag_chain(user_id: str, file_path: str, domain: str) -> ConversationalRetrievalChain:
-    if not file_path.startswith("http"):
-        file_path = get_blob_url_from_filename(file_path)
-        print(f"🔗 Converted filename to blob URL: {file_path}")
-
-    print("✅ file_path passed to build_rag_chain =", file_path)
-    return build_rag_chain(user_id=user_id, file_path=file_path, domain=domain, stream=False, handler=None)
+def get_rag_chain(
+    user_id: str,
+    file_path: str,
+    domain: str,
+    content_hash: Optional[str] = None
+) -> ConversationalRetrievalChain:
+    return get_chat_session(user_id, file_path, domain, content_hash).chain
 
 def get_rag_streaming_chain(
     user_id: str,
     blob_url: str,
     domain: str,
-    stream_handler: BaseCallbackHandler
+    content_hash: Optional[str] = None
 ):
-    if not blob_url.startswith("http"):
-        blob_url = get_blob_url_from_filename(blob_url)
-        print(f"🔗 Converted filename to blob URL: {blob_url}")
-
-    rag_chain = build_rag_chain(user_id, blob_url, domain, stream=True, handler=stream_handler)
-    llm = get_llm_by_domain(domain, stream=True, handler=stream_handler)
+    """
+    Streaming chain and LLM of the session. Pass the stream handler per call,
+    e.g. `chain.acall(inputs, callbacks=[handler])`.
+    """
+    session = get_chat_session(user_id, blob_url, domain, content_hash)
     search_tool = None  # Optional: replace this with actual tool if needed
 
-    return rag_chain, search_tool, llm
+    return session.stream_chain, search_tool, session.stream_llm
+
+
+# ---------------------------------------
+# ✅ Retrieval confidence (decides the web fallback before generation)
+# ---------------------------------------
+# Cosine similarity of the best chunk below which the document is assumed not
+# to cover the question. Assumes unit-length embeddings (all-MiniLM-L6-v2).
+RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))
+RAG_CONFIDENCE_K = int(os.getenv("RAG_CONFIDENCE_K", "4"))
 
+class RetrievalConfidence(NamedTuple):
+    score: float
+    confident: bool
+
+class FallbackStats:
+    """How often the web fallback runs and what skipping it saves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.fallbacks = 0
+        self.check_latency = metrics.LatencyStat()
+        self.fallback_latency = metrics.LatencyStat()
+
+    def record(self, fallback: bool) -> None:
+        with self._lock:
+            self.questions += 1
+            self.fallbacks += 1 if fallback else 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            questions, fallbacks = self.questions, self.fallbacks
+        fallback_latency = self.fallback_latency.snapshot()
+        # Before the confidence check every question paid for a web search
+        # plus a second generation; estimate that with the measured fallback cost.
+        saved = (questions - fallbacks) * fallback_latency["mean_ms"] / 1000
+        return {
+            "questions": questions,
+            "fallbacks": fallbacks,
+            "fallback_rate": round(fallbacks / questions, 4) if questions else 0.0,
+            "min_similarity": RAG_MIN_SIMILARITY,
+            "estimated_latency_saved_s": round(saved, 2),
+            "confidence_check": self.check_latency.snapshot(),
+            "fallback_latency": fallback_latency,
+        }
+
+fallback_stats = FallbackStats()
+metrics.register("rag_fallback", fallback_stats.snapshot)
+
+def retrieval_confidence(vs: FAISS, queries: List[str], k: int = RAG_CONFIDENCE_K) -> RetrievalConfidence:
+    started = time.perf_counter()
+    best = -1.0
+    for query in queries:
+        # FAISS returns squared L2 distances; for unit vectors cos = 1 - d / 2.
+        for _, distance in vs.similarity_search_with_score(query, k=k):
+            best = max(best, 1.0 - float(distance) / 2)
+    fallback_stats.check_latency.record(time.perf_counter() - started)
+    return RetrievalConfidence(round(best, 4), best >= RAG_MIN_SIMILARITY)
+
+def get_retrieval_confidence(session: ChatSession, question: str) -> RetrievalConfidence:
+    """
+    How well the session document's chunks match `question`, computed
+    before any generation. Takes the session the caller already holds, so
+    a question is one session lookup. Follow-ups are also scored together
+    with the previous question, since "and the second one?" alone matches nothing.
+    """
+    queries = [question]
+    previous = [m.content for m in session.memory.chat_memory.messages if m.type == "human"]
+    if previous:
+        queries.append(f"{previous[-1]} {question}")
+    return retrieval_confidence(session.vectorstore, queries)
 
-def duckduckgo_search(query: str, num_results: int = 5) -> str:
-    results_text = ""
-    with DDGS() as ddgs:
-        results = ddgs.text(query, max_results=num_results)
-        for result in results:
-            title = result.get("title", "")
-            href = result.get("href", "")
-            body = result.get("body", "")
-            results_text += f"{title}\n{body}\n{href}\n\n"
-    return results_text.strip()
 
 class FastAPIStreamingCallbackHandler(BaseCallbackHandler):
+    """
+    Puts streamed LLM tokens on `queue`. The caller puts the None sentinel
+    once the whole chain is done; a chain may run several LLM calls.
+    """
     def __init__(self):
         self.queue = asyncio.Queue()
 
     async def on_llm_new_token(self, token: str, **kwargs):
-        print("🧠 Token:", repr(token))
         if token:
             await self.queue.put(token)
-
-    async def on_llm_end(self, *args, **kwargs):
-        print("✅ on_llm_end triggered")
-        await self.queue.put(None)
@@ -0,0 +1,115 @@
+# app/services/sessions.py
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Tuple
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Chat session settings
+# ---------------------------------------
+SESSION_IDLE_TTL = int(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))  # seconds
+SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "256"))
+
+SessionKey = Tuple[str, str, str]  # (user id, document, domain)
+
+
+@dataclass
+class ChatSession:
+    """
+    Everything a chat turn needs, assembled once per (user, document, domain):
+    retriever, LLM clients, memory and the chains built from them. Streaming
+    callbacks are passed per request, never baked into the session.
+    """
+    key: SessionKey
+    vectorstore: Any
+    retriever: Any
+    memory: Any
+    llm: Any
+    stream_llm: Any
+    chain: Any
+    stream_chain: Any
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    turns: int = 0
+
+
+class SessionCache:
+    """
+    Chat sessions, evicted after `idle_ttl` seconds without use or least
+    recently used beyond `max_sessions`. A session is rebuilt when the
+    document's vectorstore object changes (index rebuilt or reloaded).
+    """
+
+    def __init__(self, idle_ttl: int = SESSION_IDLE_TTL, max_sessions: int = SESSION_MAX):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[SessionKey, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def get(self, key: SessionKey, vectorstore: Any, build: Callable[[], ChatSession]) -> ChatSession:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(key)
+            if session is not None and session.vectorstore is vectorstore:
+                self._sessions.move_to_end(key)
+                self._hits += 1
+                session.last_used = now
+                session.turns += 1
+                return session
+            self._misses += 1
+
+        session = build()
+        session.turns = 1
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+        logger.info(f"🧩 Chat session ready for {key[0]}:{key[1]} ({key[2]})")
+        return session
+
+    def drop(self, key: SessionKey) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def _expire(self, now: float) -> None:
+        # Ordered by last use, so expired sessions are at the front.
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_ttl:
+                break
+            del self._sessions[key]
+            self._expired += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            lookups = self._hits + self._misses
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "expired": self._expired,
+                "evicted": self._evicted,
+            }
+
+
+chat_sessions = SessionCache()
+metrics.register("chat_sessions", chat_sessions.stats)
@@ -0,0 +1,126 @@
+# app/services/sqlite_lru.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on bound parameters is 999.
+MAX_PARAMS = 500
+
+
+class SQLiteLRUStore:
+    """
+    Key -> blob table in a WAL-mode SQLite file, safe to share between
+    threads and worker processes. Reads refresh `last_access`; once the
+    stored size exceeds `max_bytes` the least-recently-used rows are
+    deleted, checked every `evict_every` writes rather than on every one.
+
+    Errors are raised as `sqlite3.Error`; callers decide how a failing
+    cache degrades.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        max_bytes: int,
+        value_column: str = "value",
+        evict_every: int = 64,
+        evict_batch: int = 256,
+        label: Optional[str] = None,
+    ):
+        self.path = path
+        self.table = table
+        self.value_column = value_column
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.evict_batch = evict_batch
+        self.label = label or table
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f" key TEXT PRIMARY KEY, {self.value_column} BLOB NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_access ON {self.table}(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Stored blobs for the keys present; marks them as just used."""
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            conn = self._connect()
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), MAX_PARAMS):
+                part = unique[start:start + MAX_PARAMS]
+                rows = conn.execute(
+                    f"SELECT key, {self.value_column} FROM {self.table}"
+                    f" WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(key, blob, len(blob) + len(key), now) for key, blob in items]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, {self.value_column}, size, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(conn)
+
+    def put(self, key: str, blob: bytes) -> None:
+        self.put_many([(key, blob)])
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT ?", (self.evict_batch,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+            logger.info(f"🧹 Evicted {len(rows)} {self.label} entries")
+
+    def stats(self) -> dict:
+        try:
+            with self._lock:
+                count, size = self._connect().execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+                ).fetchone()
+        except sqlite3.Error:
+            count, size = 0, 0
+        return {"entries": count, "bytes": size, "max_bytes": self.max_bytes}
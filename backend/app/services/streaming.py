@@ -0,0 +1,122 @@
+# app/services/streaming.py
+
+import os
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Optional
+
+from app.services import metrics
+
+# ---------------------------------------
+# ✅ Response streaming settings
+# ---------------------------------------
+# Buffered tokens are flushed once this much time has passed since the last
+# flush or this many characters are waiting, whichever comes first. The first
+# token is always flushed immediately.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50")) / 1000
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "64"))
+
+
+class StreamStats:
+    """Time to first/last byte of streamed answers, measured from request start."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ttfb = metrics.LatencyStat()
+        self.ttlb = metrics.LatencyStat()
+        self.streams = 0
+        self.aborted = 0
+        self.tokens = 0
+        self.chunks = 0
+        self.chars = 0
+
+    def record(self, tokens: int, chunks: int, chars: int, completed: bool) -> None:
+        with self._lock:
+            self.streams += 1
+            self.aborted += 0 if completed else 1
+            self.tokens += tokens
+            self.chunks += chunks
+            self.chars += chars
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {
+                "streams": self.streams,
+                "aborted": self.aborted,
+                "tokens": self.tokens,
+                "chunks": self.chunks,
+                "avg_chunk_chars": round(self.chars / self.chunks, 1) if self.chunks else 0.0,
+                "flush_interval_ms": STREAM_FLUSH_INTERVAL * 1000,
+                "flush_chars": STREAM_FLUSH_CHARS,
+            }
+        data["ttfb"] = self.ttfb.snapshot()
+        data["ttlb"] = self.ttlb.snapshot()
+        return data
+
+
+stream_stats = StreamStats()
+metrics.register("chat_stream", stream_stats.snapshot)
+
+
+async def coalesce(
+    queue: asyncio.Queue,
+    started: float,
+    interval: float = STREAM_FLUSH_INTERVAL,
+    max_chars: int = STREAM_FLUSH_CHARS,
+    stats: Optional[StreamStats] = stream_stats
+) -> AsyncIterator[str]:
+    """
+    Yield the text put on `queue` (until a None sentinel) in chunks flushed
+    by time and size. `started` is the request's perf_counter() start, the
+    reference for the TTFB/TTLB metrics.
+    """
+    buffer, size = [], 0
+    tokens = chunks = chars = 0
+    last_flush = time.perf_counter()
+    getter: Optional[asyncio.Future] = None
+    completed = False
+
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timeout = None
+            if buffer:
+                timeout = max(interval - (time.perf_counter() - last_flush), 0)
+            # Wait on a long-lived getter so a timeout never drops a queued token.
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if done:
+                token, getter = getter.result(), None
+                if token is None:
+                    break
+                if token:
+                    buffer.append(token)
+                    size += len(token)
+                    tokens += 1
+
+            now = time.perf_counter()
+            if buffer and (chunks == 0 or size >= max_chars or now - last_flush >= interval):
+                if chunks == 0 and stats is not None:
+                    stats.ttfb.record(now - started)
+                piece = "".join(buffer)
+                buffer, size, last_flush = [], 0, now
+                chunks += 1
+                chars += len(piece)
+                yield piece
+
+        if buffer:
+            piece = "".join(buffer)
+            if chunks == 0 and stats is not None:
+                stats.ttfb.record(time.perf_counter() - started)
+            chunks += 1
+            chars += len(piece)
+            yield piece
+        completed = True
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if stats is not None:
+            if completed:
+                stats.ttlb.record(time.perf_counter() - started)
+            stats.record(tokens, chunks, chars, completed)
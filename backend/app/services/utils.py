@@ -1,23 +1,45 @@
 import os
+import contextlib
 import fitz  # PyMuPDF
 from io import BytesIO
 from uuid import uuid4
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document as LangDoc
-from PIL import Image
+from PIL import Image, ImageOps
 import requests
 from fastapi import UploadFile
-from pdf2image import convert_from_path, convert_from_bytes
 from docx import Document as DocxDocument
-from azure.storage.blob import BlobServiceClient
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from urllib.parse import urlparse
 
-import easyocr
+from app.services.chunking import TokenChunker, build_chunks, document_text, get_profile
+from app.services.dedup import KEEP, BoilerplateFilter, ChunkDeduplicator, dedup_report
+from app.services.extraction import (
+    OCR_IMAGE_COVERAGE,
+    OCR_MIN_TEXT_CHARS,
+    OCR_SPARSE_TEXT_CHARS,
+    PAGE_BATCH_SIZE,
+    PARSER_VERSION,
+    PageText,
+    PdfSource,
+    iter_pages,
+)
+from app.services.formats import DOCX, IMAGE, PDF, detect_format
+from app.services.ocr import OCR_FINGERPRINT, ocr_service
+from app.services.parse_cache import ParseCache, ParsedDocument, content_hash, parse_cache
+from app.services.pipeline import INGEST_PAGE_QUEUE, iter_in_thread
+from app.utils.blob_cache import blob_cache
 
-# Initialize EasyOCR reader
-ocr_reader = easyocr.Reader(['en'], gpu=False)
+# DOCX has no fixed layout; paragraphs are grouped into pseudo-pages of
+# about this many characters so chunks still carry a page number.
+DOCX_PAGE_CHARS = int(os.getenv("DOCX_PAGE_CHARS", "3000"))
+
+# Anything that changes parsed output must change this fingerprint, so stale
+# parse cache entries are never served.
+PARSER_FINGERPRINT = (
+    f"pdf-{PARSER_VERSION}|{OCR_FINGERPRINT}|"
+    f"{OCR_MIN_TEXT_CHARS}:{OCR_IMAGE_COVERAGE}:{OCR_SPARSE_TEXT_CHARS}|docx-{DOCX_PAGE_CHARS}"
+)
 
 # Azure Blob Configuration
 AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
@@ -39,112 +61,248 @@ def save_uploaded_file(uploaded_file: UploadFile, user_id: int) -> str:
 # ---------------------------------------
 # ✅ Extract text from various formats
 # ---------------------------------------
+def _apply_ocr(source: PdfSource, pages: List[PageText]) -> List[PageText]:
+    """OCR the pages of a batch that have no usable text layer."""
+    missing = [page.page_number for page in pages if page.needs_ocr]
+    if missing:
+        print(f"[⚠️] OCR fallback for {len(missing)}/{len(pages)} pages: {missing}")
+        ocr_texts = ocr_service.ocr_pdf_pages(source, missing)
+        for page in pages:
+            ocr_text = ocr_texts.get(page.page_number, "")
+            if ocr_text.strip() and len(ocr_text.strip()) >= len(page.text.strip()):
+                page.text = ocr_text
+                page.ocr = True
+    return pages
+
+def iter_document_pages(source: PdfSource) -> Iterator[List[PageText]]:
+    """Per-page text of a PDF in page-ordered batches, OCR applied per batch."""
+    for batch in iter_pages(source):
+        yield _apply_ocr(source, batch)
+
+def extract_document_pages(source: PdfSource) -> List[PageText]:
+    """Per-page text of a PDF, OCR-ing only the pages without a usable text layer."""
+    return [page for batch in iter_document_pages(source) for page in batch]
+
+def iter_docx_pages(source: PdfSource) -> Iterator[List[PageText]]:
+    """
+    Paragraphs of a DOCX grouped into pseudo-pages: a new page starts after a
+    page break Word rendered, or once DOCX_PAGE_CHARS characters are reached.
+    """
+    doc = DocxDocument(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    pages: List[PageText] = []
+    lines: List[str] = []
+    size = 0
+
+    def flush() -> None:
+        nonlocal lines, size
+        if lines:
+            pages.append(PageText(page_number=len(pages) + 1, text="\n".join(lines)))
+        lines, size = [], 0
+
+    emitted = 0
+    for paragraph in doc.paragraphs:
+        text = paragraph.text
+        if text.strip():
+            lines.append(text)
+            size += len(text) + 1
+        if size >= DOCX_PAGE_CHARS or paragraph.contains_page_break:
+            flush()
+        if len(pages) - emitted >= PAGE_BATCH_SIZE:
+            yield pages[emitted:]
+            emitted = len(pages)
+    flush()
+    if len(pages) > emitted:
+        yield pages[emitted:]
+
+def iter_image_pages(source: PdfSource) -> Iterator[List[PageText]]:
+    """OCR text of an image, one page per frame (multi-page TIFF/GIF)."""
+    with Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+        for index in range(getattr(image, "n_frames", 1)):
+            image.seek(index)
+            # Phone photos are usually stored sideways with an EXIF rotation tag.
+            frame = ImageOps.exif_transpose(image)
+            yield [PageText(page_number=index + 1, text=ocr_service.ocr_image(frame), ocr=True)]
+
+_PAGE_READERS: Dict[str, Callable[[PdfSource], Iterator[List[PageText]]]] = {
+    PDF: iter_document_pages,
+    DOCX: iter_docx_pages,
+    IMAGE: iter_image_pages,
+}
+
+def iter_source_pages(source: PdfSource) -> Iterator[List[PageText]]:
+    """Per-page text of any supported document, dispatched on its magic bytes."""
+    fmt = detect_format(source)
+    print(f"📄 Detected {fmt.kind} document ({fmt.content_type})")
+    yield from _PAGE_READERS[fmt.kind](source)
+
 def extract_text_from_pdf(file_path: str) -> str:
-    text = ""
-    doc = fitz.open(file_path)
-    for page in doc:
-        page_text = page.get_text()
-        if not page_text.strip():
-            # OCR fallback
-            images = convert_from_path(file_path)
-            for image in images:
-                result = ocr_reader.readtext(np.array(image), detail=0, paragraph=True)
-                text += "\n".join(result)
-        else:
-            text += page_text
-    doc.close()
-    return text
+    return "".join(page.text for page in extract_document_pages(file_path))
 
 def extract_text_from_image(file_path: str) -> str:
-    image = Image.open(file_path)
-    result = ocr_reader.readtext(np.array(image), detail=0, paragraph=True)
-    return "\n".join(result)
+    return "\n\n".join(page.text for batch in iter_image_pages(file_path) for page in batch)
 
 def extract_text_from_docx(file_path: str) -> str:
-    doc = DocxDocument(file_path)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+    return "\n".join(page.text for batch in iter_docx_pages(file_path) for page in batch)
 
 # ---------------------------------------
-# ✅ PDF Chunking from Local or Azure Blob
+# ✅ Document Chunking from Local or Azure Blob
 # ---------------------------------------
-import numpy as np
+def _fetch_source(file_path_or_url: str, stack: contextlib.ExitStack) -> PdfSource:
+    """
+    Local path of the document: blobs come from the read-through blob cache
+    and stay pinned there until `stack` closes.
+    """
+    # ✅ CASE 1: Azure Blob URL
+    if file_path_or_url.startswith(("https://", "http://")):
+        print("🔗 Full URL =", file_path_or_url)
+        local_path = stack.enter_context(blob_cache.pinned(file_path_or_url))
+        print("✅ Azure document loaded =", local_path)
+        return local_path
 
-def load_and_chunk_pdf(file_path_or_url: str, chunk_size: int = 500) -> List[LangDoc]:
-    try:
-        full_text = ""
-        blob_data = None
+    # ✅ CASE 2: Local file
+    if not os.path.exists(file_path_or_url):
+        raise FileNotFoundError(f"File not found: {file_path_or_url}")
+    print("[DEBUG] Local document loaded =", file_path_or_url)
+    return file_path_or_url
+
+def _source_key(file_path_or_url: str) -> str:
+    """Cache alias for a source; local files include mtime/size so edits invalidate it."""
+    if file_path_or_url.startswith(("https://", "http://")):
+        # Blob names are the SHA-256 of the uploaded bytes, so the URL identifies the content.
+        return file_path_or_url
+    stat = os.stat(file_path_or_url)
+    return f"{os.path.abspath(file_path_or_url)}:{stat.st_mtime_ns}:{stat.st_size}"
 
-        # ✅ PATCH 1: Fix .neet typo
-        if ".windows.neet" in file_path_or_url:
-            print("🔥 Fixing .neet typo")
-            file_path_or_url = file_path_or_url.replace(".windows.neet", ".windows.net")
+def _lookup_parsed_document(
+    file_path_or_url: str, stack: contextlib.ExitStack
+) -> Tuple[str, str, Optional[ParsedDocument], Optional[PdfSource]]:
+    """
+    (source alias, entry key, cached parse, fetched source). On a cache hit
+    through the alias the source is not fetched at all; a fetched source is
+    valid until `stack` closes.
+    """
+    source_key = _source_key(file_path_or_url)
+    key = parse_cache.lookup_alias(source_key)
+    parsed = parse_cache.get(key) if key else None
+    if parsed is not None:
+        print(f"⚡ Parse cache hit for {file_path_or_url}")
+        return source_key, key, parsed, None
 
-        # ✅ CASE 1: Azure Blob URL
-        if file_path_or_url.startswith("https://"):
-            parsed_url = urlparse(file_path_or_url)
-            full_path = parsed_url.path.lstrip("/")
-            path_parts = full_path.strip("/").split("/")
+    source = _fetch_source(file_path_or_url, stack)
+    key = ParseCache.entry_key(content_hash(source), PARSER_FINGERPRINT)
+    parsed = parse_cache.get(key)
+    if parsed is not None:
+        parse_cache.add_alias(source_key, key)
+    return source_key, key, parsed, source
 
-            container_name = path_parts[0].strip()
-            blob_name = "/".join(path_parts[1:])
+def _fix_blob_url(file_path_or_url: str) -> str:
+    if ".windows.neet" in file_path_or_url:
+        print("🔥 Fixing .neet typo")
+        file_path_or_url = file_path_or_url.replace(".windows.neet", ".windows.net")
+    return file_path_or_url
 
-            print(f"📦 Parsed container = '{container_name}'")
-            print(f"📄 Parsed blob = '{blob_name}'")
+def load_parsed_document(file_path_or_url: str) -> Tuple[str, ParsedDocument]:
+    """
+    Per-page text of a document, served from the parse cache when possible.
+    Returns the cache entry key together with the parsed document.
+    """
+    file_path_or_url = _fix_blob_url(file_path_or_url)
+    with contextlib.ExitStack() as stack:
+        source_key, key, parsed, source = _lookup_parsed_document(file_path_or_url, stack)
+        if parsed is None:
+            # ✅ Text layer per page, OCR only where it is missing
+            parsed = ParsedDocument(pages=[page for batch in iter_source_pages(source) for page in batch])
+            parse_cache.put(key, parsed)
+            parse_cache.add_alias(source_key, key)
+    return key, parsed
 
-            blob_service = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
-            container_client = blob_service.get_container_client(container_name)
-            if not container_client.exists():
-                raise RuntimeError(f"❌ Azure container '{container_name}' does not exist (parsed from: {file_path_or_url})")
+def iter_document_chunks(file_path_or_url: str, profile: str = "retrieval") -> Iterator[List[LangDoc]]:
+    """
+    Stream the chunks of a document in batches as pages are parsed.
 
-            blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
-            print("🔍 DEBUG BLOB ACCESS")
-            print("🔗 Full URL =", file_path_or_url)
+    Extraction/OCR runs in a background stage feeding a bounded page queue;
+    repeated header/footer lines and chunks are dropped or folded according
+    to the profile, and the token chunker emits each chunk as soon as its
+    window is complete. Chunks with folded lines list them in `folded_lines`.
+    A cold parse is appended to a parse cache entry batch by batch, so only a
+    few batches are held in memory, and the entry is published once the
+    stream is exhausted; cached documents with cached bounds skip
+    tokenization altogether.
+    """
+    file_path_or_url = _fix_blob_url(file_path_or_url)
+    chunk_profile = get_profile(profile)
+    metadata = {"source": file_path_or_url}
+    boilerplate = BoilerplateFilter(mode=chunk_profile.boilerplate) if chunk_profile.boilerplate != KEEP else None
+    dedup = ChunkDeduplicator(chunk_profile.dedup)
 
-            blob_data = blob_client.download_blob().readall()
-            doc = fitz.open(stream=BytesIO(blob_data), filetype="pdf")
-            print("✅ Azure PDF loaded")
+    def clean(batch: List[PageText]) -> List[PageText]:
+        return boilerplate.apply(batch) if boilerplate else batch
 
-        # ✅ CASE 2: Local file
+    def finish(chunks: List[LangDoc]) -> List[LangDoc]:
+        chunks = dedup.apply(chunks)
+        return boilerplate.annotate(chunks) if boilerplate else chunks
+
+    with contextlib.ExitStack() as stack:
+        # A blob source stays pinned in the blob cache until the stream ends.
+        source_key, key, parsed, source = _lookup_parsed_document(file_path_or_url, stack)
+        if parsed is not None:
+            bounds = parsed.chunks.get(chunk_profile.cache_key)
+            if bounds is not None:
+                yield finish(build_chunks(document_text(clean(parsed.pages)), bounds, metadata))
+                _report_dedup(profile, dedup, boilerplate)
+                return
+            page_batches: Iterable[List[PageText]] = [parsed.pages]
         else:
-            if not os.path.exists(file_path_or_url):
-                raise FileNotFoundError(f"File not found: {file_path_or_url}")
-            doc = fitz.open(file_path_or_url)
-            print("[DEBUG] Local PDF loaded =", file_path_or_url)
-
-        for page in doc:
-            text = page.get_text()
-            if text.strip():
-                full_text += text
-        doc.close()
-
-        # ✅ OCR fallback
-        if not full_text.strip():
-            print("[⚠️] No text found in PDF. Using OCR fallback.")
-            if blob_data:
-                images = convert_from_bytes(blob_data)
-            else:
-                with open(file_path_or_url, "rb") as f:
-                    images = convert_from_bytes(f.read())
-
-            for image in images:
-                result = ocr_reader.readtext(np.array(image), detail=0, paragraph=True)
-                full_text += "\n".join(result)
-
-        if not full_text.strip():
-            raise ValueError("❗ No readable content found in PDF.")
-
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", ".", " "]
+            page_batches = iter_in_thread(iter_source_pages(source), INGEST_PAGE_QUEUE, name="parse")
+
+        chunker = TokenChunker(chunk_profile, metadata)
+        writer = parse_cache.writer(key) if parsed is None else None
+        try:
+            for batch in page_batches:
+                if writer:
+                    writer.add_pages(batch)
+                chunks = finish(chunker.feed(clean(batch)))
+                if chunks:
+                    yield chunks
+            tail = finish(chunker.finish())
+            if tail:
+                yield tail
+        except BaseException:
+            # Includes GeneratorExit: a partly read document is not cached.
+            if writer:
+                writer.abort()
+            raise
+
+        if writer:
+            writer.commit({chunk_profile.cache_key: chunker.bounds})
+            parse_cache.add_alias(source_key, key)
+        else:
+            parse_cache.put_chunks(key, chunk_profile.cache_key, chunker.bounds)
+        _report_dedup(profile, dedup, boilerplate)
+
+def _report_dedup(profile: str, dedup: ChunkDeduplicator, boilerplate: Optional[BoilerplateFilter]) -> None:
+    if boilerplate:
+        dedup.stats.boilerplate_lines = boilerplate.lines_removed
+        dedup.stats.boilerplate_tokens = boilerplate.tokens_removed
+    saved = dedup_report.record(profile, dedup.stats)
+    if saved["duplicates"] or saved["boilerplate_lines"]:
+        print(
+            f"🧽 {saved['duplicates']}/{saved['chunks']} duplicate chunks, {saved['boilerplate_lines']} boilerplate lines "
+            f"({profile}): {saved['embedding_calls_saved']} embedding calls, {saved['llm_tokens_saved']} LLM tokens saved"
         )
 
-        chunks = splitter.split_documents([
-            LangDoc(page_content=full_text, metadata={"source": file_path_or_url})
-        ])
+def load_and_chunk_document(file_path_or_url: str, profile: str = "retrieval") -> List[LangDoc]:
+    """
+    Token-sized chunks of a document for the given chunking profile, with
+    page and character-offset metadata. Boundaries are cached per profile.
+    """
+    try:
+        chunks = [chunk for batch in iter_document_chunks(file_path_or_url, profile) for chunk in batch]
+        if not chunks:
+            raise ValueError("❗ No readable content found in document.")
 
-        print(f"✅ Chunked into {len(chunks)} pieces.")
+        print(f"✅ Chunked into {len(chunks)} pieces ({profile}: {get_profile(profile).max_tokens} tokens).")
         return chunks
 
     except Exception as e:
-        raise RuntimeError(f"❌ PDF processing failed: {e}")
+        raise RuntimeError(f"❌ Document processing failed: {e}")
@@ -0,0 +1,157 @@
+# app/services/vectorstore_cache.py
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Vectorstore cache settings
+# ---------------------------------------
+VECTORSTORE_CACHE_MAX_BYTES = int(os.getenv("VECTORSTORE_CACHE_MAX_BYTES", str(1024 ** 3)))  # 1 GiB
+# Indexes loaded at startup, most recently used first.
+VECTORSTORE_PRELOAD = int(os.getenv("VECTORSTORE_PRELOAD", "8"))
+# The pickled docstore grows by about this factor once unpickled into Python objects.
+DOCSTORE_EXPANSION = 3
+# Cache hits refresh the folder mtime (the "last used" marker) at most this often.
+TOUCH_INTERVAL_SECONDS = 600
+
+Signature = Tuple[int, int, int, int]
+
+
+class _Entry(NamedTuple):
+    signature: Signature
+    store: FAISS
+    size: int
+
+
+def index_signature(folder: str) -> Optional[Signature]:
+    """mtime/size of the index files; None when there is no index."""
+    try:
+        index = os.stat(os.path.join(folder, "index.faiss"))
+        docstore = os.stat(os.path.join(folder, "index.pkl"))
+    except FileNotFoundError:
+        return None
+    return index.st_mtime_ns, index.st_size, docstore.st_mtime_ns, docstore.st_size
+
+
+def estimate_bytes(signature: Signature) -> int:
+    _, index_size, _, docstore_size = signature
+    return index_size + docstore_size * DOCSTORE_EXPANSION
+
+
+class VectorstoreCache:
+    """
+    Loaded FAISS stores keyed by index folder, LRU-evicted once their
+    estimated resident size exceeds `max_bytes`. An entry is reloaded when
+    the index files on disk change (mtime/size).
+    """
+
+    def __init__(self, max_bytes: int = VECTORSTORE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._resident = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._touched: dict = {}
+        self._load_latency = metrics.LatencyStat()
+
+    def get(self, folder: str, loader: Callable[[], FAISS]) -> FAISS:
+        """The cached store for `folder`, calling `loader` on a miss."""
+        signature = index_signature(folder)
+        with self._lock:
+            entry = self._entries.get(folder)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(folder)
+                self._hits += 1
+                self._touch(folder)
+                return entry.store
+            self._misses += 1
+
+        started = time.perf_counter()
+        store = loader()
+        self._load_latency.record(time.perf_counter() - started)
+        self.put(folder, store, signature)
+        return store
+
+    def put(self, folder: str, store: FAISS, signature: Optional[Signature] = None) -> None:
+        signature = signature or index_signature(folder)
+        if signature is None:
+            return
+        size = estimate_bytes(signature)
+        with self._lock:
+            old = self._entries.pop(folder, None)
+            if old is not None:
+                self._resident -= old.size
+            self._entries[folder] = _Entry(signature, store, size)
+            self._resident += size
+            self._touch(folder, force=True)
+            # Always keep the newest entry, even if it alone exceeds the budget.
+            while self._resident > self.max_bytes and len(self._entries) > 1:
+                evicted_folder, evicted = self._entries.popitem(last=False)
+                self._resident -= evicted.size
+                self._evictions += 1
+                logger.info(f"🧹 Evicted vectorstore {evicted_folder} ({evicted.size / 1024 ** 2:.1f} MiB)")
+
+    def invalidate(self, folder: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(folder, None)
+            if entry is not None:
+                self._resident -= entry.size
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._resident
+
+    def _touch(self, folder: str, force: bool = False) -> None:
+        """Refresh the folder mtime so startup warming knows what was used last."""
+        now = time.time()
+        if not force and now - self._touched.get(folder, 0) < TOUCH_INTERVAL_SECONDS:
+            return
+        self._touched[folder] = now
+        try:
+            os.utime(folder)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            data = {
+                "entries": len(self._entries),
+                "resident_bytes": self._resident,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+        data["load_latency"] = self._load_latency.snapshot()
+        return data
+
+
+def recently_used_indexes(root: str, limit: int) -> list:
+    """Index folders under `root`, most recently used (folder mtime) first."""
+    if not os.path.isdir(root):
+        return []
+    folders = []
+    for name in os.listdir(root):
+        folder = os.path.join(root, name)
+        if ".tmp-" in name or not os.path.exists(os.path.join(folder, "index.faiss")):
+            continue
+        folders.append((os.path.getmtime(folder), folder))
+    return [folder for _, folder in sorted(folders, reverse=True)[:limit]]
+
+
+vectorstore_cache = VectorstoreCache()
+metrics.register("vectorstores", vectorstore_cache.stats)
@@ -0,0 +1,222 @@
+# app/services/web_search.py
+
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Web search settings
+# ---------------------------------------
+# duckduckgo: live DuckDuckGo results (default)
+# fake:       canned local results, no network (tests, offline development)
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "duckduckgo").lower()
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "3"))  # seconds, hard deadline per search
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "3"))
+WEB_SEARCH_CACHE_TTL = int(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))  # seconds
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "512"))
+WEB_SEARCH_THREADS = int(os.getenv("WEB_SEARCH_THREADS", "4"))
+# Start the search together with the retrieval confidence check and drop it
+# when the document turns out to cover the question. Costs one search per
+# streamed question, so it is off by default.
+WEB_SEARCH_SPECULATIVE = os.getenv("WEB_SEARCH_SPECULATIVE", "0") == "1"
+
+NO_RESULTS = "No relevant search result found."
+
+
+class SearchResult(NamedTuple):
+    title: str
+    body: str
+    href: str
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def format_results(results: List[SearchResult]) -> str:
+    return "".join(
+        f"{i}. {r.title}\n{r.body}\n{r.href}\n\n" for i, r in enumerate(results, 1)
+    ).strip() or NO_RESULTS
+
+
+# ---------------------------------------
+# ✅ Providers
+# ---------------------------------------
+class WebSearchProvider:
+    """Async search interface; implementations must not block the event loop."""
+
+    name = "base"
+
+    async def search(self, query: str, max_results: int) -> List[SearchResult]:
+        raise NotImplementedError
+
+
+class DuckDuckGoProvider(WebSearchProvider):
+    """DuckDuckGo's blocking client, run on a small dedicated thread pool."""
+
+    name = "duckduckgo"
+
+    def __init__(self, timeout: float = WEB_SEARCH_TIMEOUT, threads: int = WEB_SEARCH_THREADS):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="web-search")
+
+    def _search(self, query: str, max_results: int) -> List[SearchResult]:
+        from duckduckgo_search import DDGS
+
+        with DDGS(timeout=max(int(self.timeout), 1)) as ddgs:
+            return [
+                SearchResult(r.get("title", ""), r.get("body", ""), r.get("href", ""))
+                for r in ddgs.text(query, max_results=max_results) or []
+            ]
+
+    async def search(self, query: str, max_results: int) -> List[SearchResult]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._search, query, max_results)
+
+
+class FakeSearchProvider(WebSearchProvider):
+    """Canned results keyed by normalized query, with an optional artificial delay."""
+
+    name = "fake"
+
+    def __init__(self, results: Optional[Dict[str, List[SearchResult]]] = None, delay: float = 0.0):
+        self.results = {normalize_query(q): r for q, r in (results or {}).items()}
+        self.delay = delay
+        self.calls = 0
+
+    async def search(self, query: str, max_results: int) -> List[SearchResult]:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        default = [SearchResult(f"Result for {query}", f"Offline placeholder result for: {query}", "https://example.com")]
+        return self.results.get(normalize_query(query), default)[:max_results]
+
+
+_PROVIDERS = {"duckduckgo": DuckDuckGoProvider, "fake": FakeSearchProvider}
+
+
+# ---------------------------------------
+# ✅ Cached, deadline-bounded search
+# ---------------------------------------
+class WebSearch:
+    """
+    Web search with a hard deadline and a TTL cache on the normalized query.
+    Concurrent searches for the same query share one provider call. A timed
+    out or failed search yields no results instead of an error.
+    """
+
+    def __init__(
+        self,
+        provider: WebSearchProvider,
+        timeout: float = WEB_SEARCH_TIMEOUT,
+        ttl: int = WEB_SEARCH_CACHE_TTL,
+        max_entries: int = WEB_SEARCH_CACHE_SIZE
+    ):
+        self.provider = provider
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[SearchResult]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._hits = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._latency = metrics.LatencyStat()
+
+    def _cached(self, key: Tuple[str, int]) -> Optional[List[SearchResult]]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None or time.time() - item[0] > self.ttl:
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return item[1]
+
+    def _store(self, key: Tuple[str, int], results: List[SearchResult]) -> None:
+        with self._lock:
+            self._cache[key] = (time.time(), results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    async def _fetch(self, query: str, key: Tuple[str, int]) -> List[SearchResult]:
+        started = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(self.provider.search(query, key[1]), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            logger.warning(f"⏱️ Web search timed out after {self.timeout}s: {query!r}")
+            return []
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            logger.warning(f"⚠️ Web search failed: {e}")
+            return []
+        finally:
+            self._latency.record(time.perf_counter() - started)
+        self._store(key, results)
+        return results
+
+    async def search(self, query: str, max_results: int = WEB_SEARCH_MAX_RESULTS) -> List[SearchResult]:
+        key = (normalize_query(query), max_results)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            self._searches += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(query, key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: one caller giving up must not cancel the search for the others.
+        return await asyncio.shield(future)
+
+    async def search_text(self, query: str, max_results: int = WEB_SEARCH_MAX_RESULTS) -> str:
+        return format_results(await self.search(query, max_results))
+
+    def start(self, query: str, max_results: int = WEB_SEARCH_MAX_RESULTS) -> "asyncio.Task[str]":
+        """Begin a search in the background, e.g. speculatively before the result is known to be needed."""
+        return asyncio.ensure_future(self.search_text(query, max_results))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._searches + self._hits
+            data = {
+                "provider": self.provider.name,
+                "timeout_seconds": self.timeout,
+                "speculative": WEB_SEARCH_SPECULATIVE,
+                "lookups": lookups,
+                "cache_hits": self._hits,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "cache_entries": len(self._cache),
+                "timeouts": self._timeouts,
+                "errors": self._errors,
+            }
+        data["latency"] = self._latency.snapshot()
+        return data
+
+
+def _create_provider() -> WebSearchProvider:
+    provider = WEB_SEARCH_PROVIDER if WEB_SEARCH_PROVIDER in _PROVIDERS else "duckduckgo"
+    if provider != WEB_SEARCH_PROVIDER:
+        logger.warning(f"⚠️ Unknown WEB_SEARCH_PROVIDER '{WEB_SEARCH_PROVIDER}', using duckduckgo")
+    return _PROVIDERS[provider]()
+
+
+web_search = WebSearch(_create_provider())
+metrics.register("web_search", web_search.stats)
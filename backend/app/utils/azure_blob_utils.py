@@ -1,10 +1,124 @@
-from azure.storage.blob import BlobServiceClient
+import asyncio
+import base64
+from functools import lru_cache
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+from urllib.parse import urlparse, unquote
+
+from azure.storage.blob import BlobBlock, BlobClient, BlobServiceClient, ContentSettings
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
 import os
 
 AZURE_CONTAINER_NAME = os.getenv("AZURE_BLOB_CONTAINER")
 AZURE_CONN_STR = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 
+# Blobs above the single-GET size are fetched as parallel ranged GETs.
+BLOB_MAX_SINGLE_GET_SIZE = int(os.getenv("BLOB_MAX_SINGLE_GET_SIZE", str(8 * 1024 * 1024)))
+BLOB_MAX_CHUNK_GET_SIZE = int(os.getenv("BLOB_MAX_CHUNK_GET_SIZE", str(4 * 1024 * 1024)))
+
+# Uploads are staged as block-blob blocks of this size, several in flight.
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(4 * 1024 * 1024)))
+UPLOAD_BLOCK_CONCURRENCY = int(os.getenv("UPLOAD_BLOCK_CONCURRENCY", "4"))
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=1)
+def get_blob_service() -> BlobServiceClient:
+    """Process-wide BlobServiceClient (one connection pool per worker)."""
+    return BlobServiceClient.from_connection_string(
+        AZURE_CONN_STR,
+        max_single_get_size=BLOB_MAX_SINGLE_GET_SIZE,
+        max_chunk_get_size=BLOB_MAX_CHUNK_GET_SIZE,
+    )
+
+
+def parse_blob_url(url: str) -> Tuple[str, str]:
+    """Split a blob URL into (container, blob name); handles Azurite-style URLs."""
+    parsed = urlparse(url)
+    parts = unquote(parsed.path).strip("/").split("/")
+    # Emulator URLs carry the account name as the first path segment:
+    # http://127.0.0.1:10000/devstoreaccount1/<container>/<blob>
+    if ".blob." not in parsed.netloc and len(parts) > 2:
+        parts = parts[1:]
+    return parts[0].strip(), "/".join(parts[1:])
+
+
 def get_blob_url_from_filename(filename: str) -> str:
-    blob_service = BlobServiceClient.from_connection_string(AZURE_CONN_STR)
-    blob_client = blob_service.get_blob_client(container=AZURE_CONTAINER_NAME, blob=filename)
+    blob_client = get_blob_service().get_blob_client(container=AZURE_CONTAINER_NAME, blob=filename)
     return blob_client.url
+
+
+async def upload_stream_to_blob(
+    file: UploadFile,
+    blob_client: BlobClient,
+    content_type: str,
+    local_path: Optional[str] = None,
+) -> int:
+    """
+    Stream an upload to a block blob in UPLOAD_BLOCK_SIZE blocks.
+
+    Up to UPLOAD_BLOCK_CONCURRENCY blocks are staged in parallel, so memory
+    stays bounded by concurrency x block size whatever the file size. The
+    optional local copy is written from the same blocks. Returns the byte size.
+    """
+    semaphore = asyncio.Semaphore(UPLOAD_BLOCK_CONCURRENCY)
+    tasks = []
+    block_list = []
+    size = 0
+
+    async def stage(block_id: str, data: bytes) -> None:
+        try:
+            await run_in_threadpool(blob_client.stage_block, block_id, data, length=len(data))
+        finally:
+            semaphore.release()
+
+    local_file = open(local_path, "wb") if local_path else None
+    try:
+        while True:
+            data = await file.read(UPLOAD_BLOCK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            if local_file:
+                await run_in_threadpool(local_file.write, data)
+
+            block_id = base64.b64encode(f"{len(block_list):08d}".encode()).decode()
+            block_list.append(BlobBlock(block_id=block_id))
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(stage(block_id, data)))
+
+            failed = next((t for t in tasks if t.done() and t.exception()), None)
+            if failed:
+                raise failed.exception()
+
+        await asyncio.gather(*tasks)
+        await run_in_threadpool(
+            blob_client.commit_block_list,
+            block_list,
+            content_settings=ContentSettings(content_type=content_type),
+        )
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        if local_file:
+            local_file.close()
+    return size
+
+
+async def upload_batch(uploads: Sequence[Awaitable[T]], discard: Callable[[T], Awaitable[None]]) -> List[T]:
+    """
+    Run uploads concurrently, all or nothing: if any fails, the ones that
+    completed are passed to `discard` before the first error is re-raised,
+    so no blob is left in storage without a record pointing at it.
+    """
+    results = await asyncio.gather(*uploads, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        for result in results:
+            if not isinstance(result, BaseException):
+                await discard(result)
+        raise errors[0]
+    return list(results)
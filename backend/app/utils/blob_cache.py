@@ -0,0 +1,221 @@
+# app/utils/blob_cache.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, Optional
+
+from app.utils.azure_blob_utils import get_blob_service, parse_blob_url
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------
+# ✅ Cache settings
+# ---------------------------------------
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "blob_cache")
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))  # 5 GiB
+# Within this window a cached file is served without asking the server again.
+BLOB_REVALIDATE_SECONDS = float(os.getenv("BLOB_REVALIDATE_SECONDS", "60"))
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+# "azure" (real account or Azurite via the connection string) or "local"
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "azure")
+BLOB_LOCAL_ROOT = os.getenv("BLOB_LOCAL_ROOT", "local_blobs")
+
+
+@dataclass
+class BlobInfo:
+    etag: str
+    last_modified: Optional[str]
+    size: int
+
+
+# ---------------------------------------
+# ✅ Storage backends
+# ---------------------------------------
+class AzureBlobBackend:
+    """Azure Blob Storage (or Azurite) through the shared BlobServiceClient."""
+
+    def properties(self, container: str, blob: str) -> BlobInfo:
+        props = get_blob_service().get_blob_client(container=container, blob=blob).get_blob_properties()
+        modified = props.last_modified.isoformat() if props.last_modified else None
+        return BlobInfo(etag=props.etag, last_modified=modified, size=props.size)
+
+    def download_to(self, container: str, blob: str, fileobj: BinaryIO, info: BlobInfo) -> None:
+        from azure.core import MatchConditions
+
+        blob_client = get_blob_service().get_blob_client(container=container, blob=blob)
+        # Ranged GETs run in parallel and are written straight into the file;
+        # the ETag condition guarantees every range comes from the same version.
+        downloader = blob_client.download_blob(
+            max_concurrency=BLOB_DOWNLOAD_CONCURRENCY,
+            etag=info.etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+        downloader.readinto(fileobj)
+
+
+class LocalBlobBackend:
+    """Filesystem stand-in: <root>/<container>/<blob>, ETag derived from mtime and size."""
+
+    def __init__(self, root: str = BLOB_LOCAL_ROOT):
+        self.root = root
+
+    def _path(self, container: str, blob: str) -> str:
+        return os.path.join(self.root, container, *blob.split("/"))
+
+    def properties(self, container: str, blob: str) -> BlobInfo:
+        stat = os.stat(self._path(container, blob))
+        return BlobInfo(etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', last_modified=str(stat.st_mtime), size=stat.st_size)
+
+    def download_to(self, container: str, blob: str, fileobj: BinaryIO, info: BlobInfo) -> None:
+        with open(self._path(container, blob), "rb") as f:
+            shutil.copyfileobj(f, fileobj, 1024 * 1024)
+
+
+# ---------------------------------------
+# ✅ Read-through cache
+# ---------------------------------------
+class BlobCache:
+    """
+    Read-through local copy of blobs.
+
+    Each blob is stored once on disk next to a small JSON sidecar holding its
+    ETag. A hit is revalidated with one properties request (at most every
+    `revalidate_seconds`); only a changed ETag triggers a new download.
+    Files are evicted least-recently-used above `max_bytes`, except while a
+    caller holds them through `pinned`.
+    """
+
+    def __init__(self, backend=None, root: str = BLOB_CACHE_DIR, max_bytes: int = BLOB_CACHE_MAX_BYTES,
+                 revalidate_seconds: float = BLOB_REVALIDATE_SECONDS):
+        self.backend = backend or (LocalBlobBackend() if BLOB_BACKEND == "local" else AzureBlobBackend())
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        self._evict_lock = threading.Lock()
+        self._validated: Dict[str, float] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _paths(self, container: str, blob: str):
+        key = hashlib.sha1(f"{container}/{blob}".encode("utf-8")).hexdigest()
+        ext = os.path.splitext(blob)[1].lower()
+        data_path = os.path.join(self.root, f"{key}{ext}")
+        return key, data_path, f"{data_path}.meta.json"
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[dict]:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @contextlib.contextmanager
+    def pinned(self, url: str) -> Iterator[str]:
+        """
+        Local file path holding the current content of the blob at `url`.
+        The file is not evicted before the block exits.
+        """
+        key, data_path, downloaded = self._checkout(url)
+        try:
+            if downloaded:
+                self._evict()
+            yield data_path
+        finally:
+            self._unpin(key)
+
+    def _pin(self, key: str) -> None:
+        # Taken under the key lock, which the evictor holds while it checks pins.
+        with self._locks_guard:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _unpin(self, key: str) -> None:
+        with self._locks_guard:
+            self._pins[key] -= 1
+            if not self._pins[key]:
+                del self._pins[key]
+
+    def _checkout(self, url: str):
+        """(key, path, downloaded) of a validated local copy, pinned for the caller."""
+        container, blob = parse_blob_url(url)
+        key, data_path, meta_path = self._paths(container, blob)
+
+        with self._lock_for(key):
+            meta = self._read_meta(meta_path)
+            have_file = meta is not None and os.path.exists(data_path)
+
+            if have_file and time.monotonic() - self._validated.get(key, float("-inf")) < self.revalidate_seconds:
+                os.utime(data_path)
+                self._pin(key)
+                return key, data_path, False
+
+            info = self.backend.properties(container, blob)
+            if have_file and meta.get("etag") == info.etag:
+                self._validated[key] = time.monotonic()
+                os.utime(data_path)
+                self._pin(key)
+                return key, data_path, False
+
+            logger.info(f"⬇️ Downloading blob {container}/{blob} ({info.size} bytes)")
+            tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.part"
+            try:
+                with open(tmp_path, "wb") as f:
+                    self.backend.download_to(container, blob, f, info)
+                os.replace(tmp_path, data_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"etag": info.etag, "last_modified": info.last_modified, "size": info.size}, f)
+            self._validated[key] = time.monotonic()
+            self._pin(key)
+        return key, data_path, True
+
+    def _evict(self) -> None:
+        # One evictor at a time; a blob that is pinned, or whose key lock is
+        # held (being validated or downloaded), is skipped.
+        with self._evict_lock:
+            files = []
+            total = 0
+            for item in os.scandir(self.root):
+                if item.is_file() and not item.name.endswith((".meta.json", ".part")):
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = item.stat()
+                        files.append((stat.st_mtime, stat.st_size, item.path))
+                        total += stat.st_size
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                key = os.path.basename(path).split(".", 1)[0]
+                lock = self._lock_for(key)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    with self._locks_guard:
+                        if self._pins.get(key):
+                            continue
+                    for victim in (path, f"{path}.meta.json"):
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(victim)
+                    self._validated.pop(key, None)
+                finally:
+                    lock.release()
+                total -= size
+                logger.info(f"🧹 Evicted cached blob {os.path.basename(path)}")
+
+
+blob_cache = BlobCache()
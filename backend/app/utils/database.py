@@ -50,6 +50,7 @@ def init_db():
         print("⚠️ Database init failed:", err)
 
 # ▶️ Models import (ensure all ORM classes are loaded)
+from app.models.artifact import DocumentArtifact
 from app.models.documents import Document
 from app.auth.models import User
 from app.models.chat import ChatHistory
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend as `app`, the same way uvicorn does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level caches are created on import; keep them out of the source tree.
+_CACHE_ROOT = tempfile.mkdtemp(prefix="docai-tests-")
+os.environ.setdefault("PARSE_CACHE_DIR", os.path.join(_CACHE_ROOT, "parse_cache"))
+os.environ.setdefault("BLOB_CACHE_DIR", os.path.join(_CACHE_ROOT, "blob_cache"))
+os.environ.setdefault("OCR_CACHE_PATH", os.path.join(_CACHE_ROOT, "ocr_cache", "ocr_results.sqlite3"))
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(_CACHE_ROOT, "embedding_cache", "embeddings.sqlite3"))
+os.environ.setdefault("CHAT_MEMORY_PATH", os.path.join(_CACHE_ROOT, "chat_memory", "memory.sqlite3"))
@@ -0,0 +1,145 @@
+import os
+import threading
+
+from app.utils.blob_cache import BlobCache, LocalBlobBackend
+
+URL = "https://acct.blob.core.windows.net/user-docs/{}"
+
+
+class CountingBackend(LocalBlobBackend):
+    def __init__(self, root):
+        super().__init__(str(root))
+        self.downloads = 0
+        self.properties_calls = 0
+
+    def properties(self, container, blob):
+        self.properties_calls += 1
+        return super().properties(container, blob)
+
+    def download_to(self, container, blob, fileobj, info):
+        self.downloads += 1
+        super().download_to(container, blob, fileobj, info)
+
+
+def _put_blob(root, name, data: bytes, mtime_ns=None):
+    path = root / "user-docs" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def _get_path(cache, url):
+    with cache.pinned(url) as path:
+        return path
+
+
+def _cache(tmp_path, **kwargs):
+    backend = CountingBackend(tmp_path / "blobs")
+    return backend, BlobCache(backend=backend, root=str(tmp_path / "cache"), **kwargs)
+
+
+def test_miss_downloads_and_hit_serves_local_copy(tmp_path):
+    _put_blob(tmp_path / "blobs", "a.pdf", b"version 1")
+    backend, cache = _cache(tmp_path, revalidate_seconds=3600)
+
+    first = _get_path(cache, URL.format("a.pdf"))
+    second = _get_path(cache, URL.format("a.pdf"))
+
+    assert first == second
+    assert open(first, "rb").read() == b"version 1"
+    assert backend.downloads == 1
+    assert backend.properties_calls == 1  # the hit was within the revalidation window
+
+
+def test_unchanged_etag_revalidates_without_download(tmp_path):
+    _put_blob(tmp_path / "blobs", "a.pdf", b"version 1")
+    backend, cache = _cache(tmp_path, revalidate_seconds=0)
+
+    _get_path(cache, URL.format("a.pdf"))
+    _get_path(cache, URL.format("a.pdf"))
+
+    assert backend.properties_calls == 2
+    assert backend.downloads == 1
+
+
+def test_changed_etag_refreshes_the_copy(tmp_path):
+    _put_blob(tmp_path / "blobs", "a.pdf", b"version 1", mtime_ns=1_000_000_000)
+    backend, cache = _cache(tmp_path, revalidate_seconds=0)
+    path = _get_path(cache, URL.format("a.pdf"))
+
+    _put_blob(tmp_path / "blobs", "a.pdf", b"version 2!", mtime_ns=2_000_000_000)
+    assert _get_path(cache, URL.format("a.pdf")) == path
+
+    assert open(path, "rb").read() == b"version 2!"
+    assert backend.downloads == 2
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        _put_blob(tmp_path / "blobs", name, b"x" * 100)
+    _, cache = _cache(tmp_path, max_bytes=250, revalidate_seconds=3600)
+
+    a = _get_path(cache, URL.format("a.pdf"))
+    os.utime(a, (1, 1))
+    b = _get_path(cache, URL.format("b.pdf"))
+    os.utime(b, (2, 2))
+    c = _get_path(cache, URL.format("c.pdf"))
+
+    assert not os.path.exists(a) and not os.path.exists(f"{a}.meta.json")
+    assert os.path.exists(b) and os.path.exists(c)
+
+
+def test_eviction_skips_blobs_with_in_flight_locks(tmp_path):
+    for name in ("a.pdf", "b.pdf"):
+        _put_blob(tmp_path / "blobs", name, b"x" * 100)
+    _, cache = _cache(tmp_path, max_bytes=150, revalidate_seconds=3600)
+    a = _get_path(cache, URL.format("a.pdf"))
+    os.utime(a, (1, 1))
+
+    key = os.path.basename(a).split(".", 1)[0]
+    with cache._lock_for(key):
+        b = _get_path(cache, URL.format("b.pdf"))
+        assert os.path.exists(a)  # in use, so over budget for now
+    os.utime(b, (3, 3))
+    cache._evict()
+    assert not os.path.exists(a)
+
+
+def test_pinned_file_survives_eviction_until_released(tmp_path):
+    for name in ("a.pdf", "b.pdf"):
+        _put_blob(tmp_path / "blobs", name, b"x" * 100)
+    _, cache = _cache(tmp_path, max_bytes=150, revalidate_seconds=3600)
+
+    with cache.pinned(URL.format("a.pdf")) as a:
+        os.utime(a, (1, 1))  # least recently used
+        b = _get_path(cache, URL.format("b.pdf"))  # over budget, evicts what it can
+        assert open(a, "rb").read() == b"x" * 100
+    os.utime(b, (3, 3))
+    cache._evict()
+
+    assert not os.path.exists(a) and os.path.exists(b)
+
+
+def test_concurrent_evictions_do_not_raise(tmp_path):
+    names = [f"{i}.pdf" for i in range(12)]
+    for name in names:
+        _put_blob(tmp_path / "blobs", name, b"x" * 100)
+    _, cache = _cache(tmp_path, max_bytes=300, revalidate_seconds=3600)
+    errors = []
+
+    def worker(batch):
+        try:
+            for name in batch:
+                _get_path(cache, URL.format(name))
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(names[i::4],)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
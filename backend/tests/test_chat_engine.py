@@ -0,0 +1,65 @@
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+from langchain.memory import ConversationBufferMemory
+
+from app.services import chat_engine
+from app.services.chat_engine import RetrievalChatEngine, needs_rewrite
+
+
+class NamedFakeChatModel(FakeListChatModel):
+    model_name: str
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [Document(page_content=f"context for {query}")]
+
+
+class GatewaySpy:
+    def __init__(self):
+        self.calls = []
+        self.depth = 0
+
+    def call(self, model, fn, priority, tokens=None):
+        self.calls.append((model, self.depth))
+        self.depth += 1
+        try:
+            return fn()
+        finally:
+            self.depth -= 1
+
+
+def _engine(monkeypatch):
+    spy = GatewaySpy()
+    monkeypatch.setattr(chat_engine, "llm_gateway", spy)
+    engine = RetrievalChatEngine.from_llm(
+        llm=NamedFakeChatModel(model_name="answer-model", responses=["answer"] * 4),
+        condense_question_llm=NamedFakeChatModel(model_name="rewrite-model", responses=["standalone question"] * 4),
+        retriever=StaticRetriever(),
+        memory=ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer"),
+        output_key="answer",
+    )
+    return engine, spy
+
+
+def test_needs_rewrite_only_for_follow_ups():
+    history = [("What is the fee?", "100 EUR")]
+    assert not needs_rewrite("What is the fee?", [])
+    assert needs_rewrite("and the second one?", history)
+    assert not needs_rewrite("Which court has jurisdiction over disputes under the contract?", history)
+
+
+def test_condense_and_answer_are_charged_to_their_own_models(monkeypatch):
+    engine, spy = _engine(monkeypatch)
+
+    engine.invoke({"question": "What is the fee?"})
+    assert spy.calls == [("answer-model", 0)]  # no history, no rewrite
+
+    spy.calls.clear()
+    engine.invoke({"question": "and why?"})
+    # Separate, non-nested admissions: the rewrite never holds an answer slot.
+    assert spy.calls == [("rewrite-model", 0), ("answer-model", 0)]
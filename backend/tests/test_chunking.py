@@ -0,0 +1,32 @@
+import tiktoken.load
+
+from app.services import chunking
+from app.services.extraction import PageText
+
+
+def test_bundled_encoding_loads_without_network(monkeypatch):
+    def no_network(blobpath):
+        raise AssertionError(f"tried to download {blobpath}")
+
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+    monkeypatch.setattr(tiktoken.load, "read_file", no_network)
+    chunking._encoding.cache_clear()
+    try:
+        assert chunking.count_tokens("hello world") == 2
+    finally:
+        chunking._encoding.cache_clear()
+
+
+def test_chunks_do_not_depend_on_page_batching():
+    pages = [PageText(page_number=n, text=f"Page {n} " + "lorem ipsum dolor " * 40) for n in range(1, 7)]
+    profile = chunking.get_profile("retrieval")
+
+    whole = chunking.TokenChunker(profile)
+    whole.feed(pages)
+    whole.finish()
+    batched = chunking.TokenChunker(profile)
+    for page in pages:
+        batched.feed([page])
+    batched.finish()
+
+    assert batched.bounds == whole.bounds
@@ -0,0 +1,115 @@
+from langchain_core.documents import Document as LangDoc
+
+from app.services.dedup import DROP, FOLD, BoilerplateFilter, ChunkDeduplicator, DedupReport, DedupStats, expand_folded
+from app.services.extraction import PageText
+
+
+def _chunk(text: str) -> LangDoc:
+    return LangDoc(page_content=text, metadata={"token_count": len(text.split())})
+
+
+INVOICE_LINE = (
+    "Item {n}: replacement filter cartridge, quantity {q}, unit price {p} EUR, "
+    "delivered to the north warehouse on the agreed schedule with standard terms."
+)
+
+
+def test_chunks_differing_only_in_numbers_are_kept():
+    dedup = ChunkDeduplicator(DROP)
+    first = "\n".join(INVOICE_LINE.format(n=i, q=10, p=25) for i in range(1, 9))
+    second = "\n".join(INVOICE_LINE.format(n=i, q=10, p=26) for i in range(1, 9))
+
+    kept = dedup.apply([_chunk(first), _chunk(second)])
+
+    assert [c.page_content for c in kept] == [first, second]
+    assert dedup.stats.duplicates == 0
+
+
+def test_near_duplicate_with_same_numbers_is_dropped():
+    dedup = ChunkDeduplicator(DROP)
+    first = "\n".join(INVOICE_LINE.format(n=i, q=10, p=25) for i in range(1, 9))
+    second = first.replace("north", "North ").replace("standard", "Standard")
+
+    kept = dedup.apply([_chunk(first), _chunk(second)])
+
+    assert len(kept) == 1
+    assert dedup.stats.duplicates == 1
+
+
+def test_boilerplate_ignores_page_numbers():
+    boilerplate = BoilerplateFilter(min_pages=2)
+    bodies = ["Scope of work", "Payment terms", "Liability", "Termination"]
+    pages = [PageText(page_number=n, text=f"ACME Corp - page {n}\n{body}") for n, body in enumerate(bodies, 1)]
+
+    cleaned = boilerplate.apply(pages)
+
+    assert [p.text for p in cleaned] == [
+        "ACME Corp - page 1\nScope of work",
+        "ACME Corp - page 2\nPayment terms",
+        "Liability",
+        "Termination",
+    ]
+    assert boilerplate.lines_removed == 2
+
+
+def test_boilerplate_keeps_body_lines_with_different_figures():
+    boilerplate = BoilerplateFilter(min_pages=3)
+    totals = [417, 88, 1290, 55, 610]
+    pages = [
+        PageText(
+            page_number=n,
+            text=(
+                f"ACME Corp Invoice 2024-03-{n:02d}\n"
+                "Customer: Northwind\n"
+                f"Item {n}: filter cartridge\n"
+                "Qty: 4\n"
+                "Unit price: 12.50\n"
+                "Thank you for your business\n"
+                f"Invoice Total: {total}.00"
+            ),
+        )
+        for n, total in enumerate(totals, 1)
+    ]
+
+    cleaned = boilerplate.apply(pages)
+
+    # Header/footer lines seen on three earlier pages go (the date is masked);
+    # body lines stay even when repeated, and a total is never matched across figures.
+    assert [p.text for p in cleaned[3:]] == [
+        "Item 4: filter cartridge\nQty: 4\nUnit price: 12.50\nInvoice Total: 55.00",
+        "Item 5: filter cartridge\nQty: 4\nUnit price: 12.50\nInvoice Total: 610.00",
+    ]
+    assert boilerplate.lines_removed == 6
+
+
+def test_fold_replaces_repeated_lines_with_references():
+    boilerplate = BoilerplateFilter(min_pages=1, mode=FOLD)
+    pages = [PageText(page_number=n, text=f"CONFIDENTIAL\nClause {n}") for n in range(1, 4)]
+
+    cleaned = boilerplate.apply(pages)
+    chunks = boilerplate.annotate([_chunk(page.text) for page in cleaned])
+
+    assert [p.text for p in cleaned] == ["CONFIDENTIAL\nClause 1", "⟦0⟧\nClause 2", "⟦0⟧\nClause 3"]
+    assert boilerplate.folded[0].text == "CONFIDENTIAL" and boilerplate.folded[0].page == 2
+    assert "folded_lines" not in chunks[0].metadata
+    assert chunks[1].metadata["folded_lines"] == {0: "CONFIDENTIAL"}
+    assert expand_folded(cleaned[2].text, {0: "VERTRAULICH"}) == "VERTRAULICH\nClause 3"
+
+
+def test_fold_keeps_lines_that_differ_in_numbers():
+    boilerplate = BoilerplateFilter(min_pages=1, mode=FOLD)
+    pages = [PageText(page_number=n, text=f"Page {n} of 3") for n in range(1, 4)]
+
+    cleaned = boilerplate.apply(pages)
+
+    assert [p.text for p in cleaned] == ["Page 1 of 3", "Page 2 of 3", "Page 3 of 3"]
+    assert boilerplate.folded == []
+
+
+def test_report_does_not_expose_sources():
+    report = DedupReport()
+    report.record("retrieval", DedupStats(chunks=4, duplicates=1))
+
+    recent = report.snapshot()["recent"]
+
+    assert recent == [{"profile": "retrieval", **DedupStats(chunks=4, duplicates=1).to_dict("retrieval")}]
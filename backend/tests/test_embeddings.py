@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services import embeddings
+from app.services.embeddings import BackendUnavailableError, load_model
+
+
+class StubModel:
+    """Encodes each text to a fixed unit vector, optionally skewed by `noise`."""
+
+    def __init__(self, noise: float = 0.0):
+        self.noise = noise
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        vectors = []
+        for i, _ in enumerate(texts):
+            v = np.zeros(8, dtype=np.float32)
+            v[i % 8] = 1.0
+            v[(i + 1) % 8] += self.noise
+            vectors.append(v / np.linalg.norm(v))
+        return np.stack(vectors)
+
+
+def _loaders(candidate):
+    reference = StubModel()
+    return {"torch": lambda: reference, "int8": candidate}, reference
+
+
+def test_backend_passing_parity_is_used():
+    candidate = StubModel(noise=0.01)
+    loaders, _ = _loaders(lambda: candidate)
+
+    assert load_model("int8", loaders) == (candidate, "int8")
+
+
+def test_backend_failing_parity_falls_back_to_torch():
+    loaders, reference = _loaders(lambda: StubModel(noise=1.0))  # cosine ~0.71
+
+    assert load_model("int8", loaders) == (reference, "torch")
+
+
+def test_backend_that_fails_to_load_falls_back_to_torch():
+    def broken():
+        raise RuntimeError("corrupt export")
+
+    loaders, reference = _loaders(broken)
+
+    assert load_model("int8", loaders) == (reference, "torch")
+
+
+def test_onnx_without_optimum_is_a_clear_error(monkeypatch):
+    monkeypatch.setattr(embeddings, "find_spec", lambda name: None)
+
+    with pytest.raises(BackendUnavailableError, match="optimum"):
+        load_model("onnx", {"torch": StubModel, "onnx": embeddings._load_onnx})
@@ -0,0 +1,12 @@
+import asyncio
+
+from app.services.llm_clients import LLMClientRegistry
+
+
+def test_aclose_closes_sync_and_async_clients():
+    registry = LLMClientRegistry()
+    sync_client = registry.sync_client("model")
+    async_client = registry.async_client("model", streaming=True)
+    asyncio.run(registry.aclose())
+    assert sync_client.is_closed and async_client.is_closed
+    assert registry.async_client("model", streaming=True) is not async_client
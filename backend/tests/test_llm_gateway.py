@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import threading
+import time
+
+import httpx
+import pytest
+from groq import RateLimitError
+
+from app.services.llm_gateway import LLMGateway, ModelLimits, Priority
+
+
+def _gateway(**kwargs):
+    return LLMGateway(max_retries=kwargs.pop("max_retries", 2), limits=kwargs.pop("limits", {}), **kwargs)
+
+
+def _queue(gateway, model, priority, tokens=10):
+    waiter = gateway._new_waiter(model, priority, tokens)
+    waiter.event = threading.Event()
+    heapq.heappush(gateway._queue, waiter)
+    return waiter
+
+
+def _rate_limit_error(retry_after: str) -> RateLimitError:
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def test_interactive_waiter_is_admitted_before_earlier_batch_waiter():
+    gateway = _gateway(max_concurrency=1)
+    batch = _queue(gateway, "m", Priority.BATCH)
+    interactive = _queue(gateway, "m", Priority.INTERACTIVE)
+
+    gateway._dispatch()
+
+    assert interactive.granted and not batch.granted
+    gateway._release("m", 10)
+    gateway._dispatch()
+    assert batch.granted
+
+
+def test_same_priority_waiters_are_admitted_in_arrival_order():
+    gateway = _gateway(max_concurrency=1)
+    first = _queue(gateway, "m", Priority.BATCH)
+    second = _queue(gateway, "m", Priority.BATCH)
+
+    gateway._dispatch()
+
+    assert first.granted and not second.granted
+
+
+def test_token_bucket_wait_blocks_model_without_overtaking():
+    gateway = _gateway(limits={"small": (60, 600), "other": (60, 600)})
+    big = _queue(gateway, "small", Priority.INTERACTIVE, tokens=500)
+    gateway._dispatch()
+    assert big.granted
+
+    blocked = _queue(gateway, "small", Priority.INTERACTIVE, tokens=500)
+    tiny = _queue(gateway, "small", Priority.BATCH, tokens=1)
+    other = _queue(gateway, "other", Priority.BATCH, tokens=1)
+    wake = gateway._dispatch()
+
+    # 600 tpm refills 10 tokens/s; 400 more are needed.
+    assert wake == pytest.approx(40, abs=0.5)
+    assert not blocked.granted
+    assert not tiny.granted  # would fit, but must not overtake the blocked waiter
+    assert other.granted  # other models are unaffected
+
+
+def test_model_limits_wait_for_requests_and_tokens():
+    limits = ModelLimits(rpm=2, tpm=1000)
+    now = time.monotonic()
+    limits.take(100, now)
+    limits.take(100, now)
+
+    assert limits.wait_time(100, now) == pytest.approx(30)  # 2 rpm: one request per 30 s
+    assert limits.wait_time(100, now + 30) == 0
+
+
+def test_rate_limit_pauses_the_whole_model_for_retry_after():
+    gateway = _gateway()
+    delay = gateway._retry_delay("m", _rate_limit_error("7"), attempt=0)
+
+    assert delay >= 7
+    waiter = _queue(gateway, "m", Priority.INTERACTIVE)
+    wake = gateway._dispatch()
+    assert not waiter.granted
+    assert wake == pytest.approx(delay, abs=0.5)
+    assert gateway.stats()["rate_limited"] == 1
+
+
+def test_call_retries_rate_limited_calls(monkeypatch):
+    gateway = _gateway()
+    monkeypatch.setattr(gateway, "_retry_delay", lambda model, error, attempt: 0.0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise _rate_limit_error("0")
+        return "ok"
+
+    assert gateway.call("m", flaky, Priority.BATCH) == "ok"
+    assert len(attempts) == 2
+    assert gateway._active == 0
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    gateway = _gateway()
+    assert gateway._retry_delay("m", ValueError("bad prompt"), attempt=0) is None
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    gateway = _gateway(max_concurrency=1)
+
+    async def scenario():
+        await gateway._aacquire("m", Priority.INTERACTIVE, 10)  # takes the only slot
+        waiting = asyncio.ensure_future(gateway._aacquire("m", Priority.INTERACTIVE, 10))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            with gateway._cond:
+                if gateway._queue:
+                    break
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        with gateway._cond:
+            assert gateway._queue == []
+            assert gateway._active == 1
+        gateway._release("m", 10)
+        # The freed slot goes to a new caller, not to the cancelled one.
+        await asyncio.wait_for(gateway._aacquire("m", Priority.INTERACTIVE, 10), timeout=2)
+        gateway._release("m", 10)
+
+    asyncio.run(scenario())
+    assert gateway._active == 0
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.memory_store import LRUMemoryBackend, MemoryStore, RedisMemoryBackend, SQLiteMemoryBackend
+
+TURNS_PER_THREAD = 15
+THREADS = 4
+
+
+def _concurrent_turns(store: MemoryStore, key: str) -> None:
+    def worker(n: int):
+        for i in range(TURNS_PER_THREAD):
+            store.append(key, [HumanMessage(content=f"q{n}-{i}"), AIMessage(content=f"a{n}-{i}")])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def _assert_no_lost_turns(store: MemoryStore, key: str) -> None:
+    messages = store.load(key)
+    assert len(messages) == 2 * TURNS_PER_THREAD * THREADS
+    # Each turn's question is directly followed by its answer.
+    for question, answer in zip(messages[::2], messages[1::2]):
+        assert answer.content == "a" + question.content[1:]
+
+
+def test_lru_concurrent_turns_are_not_lost():
+    store = MemoryStore(LRUMemoryBackend(), max_tokens=100_000)
+    _concurrent_turns(store, "u:doc")
+    _assert_no_lost_turns(store, "u:doc")
+
+
+def test_sqlite_concurrent_turns_across_connections_are_not_lost(tmp_path):
+    path = str(tmp_path / "memory.sqlite3")
+    # Two backends on one file stand in for two worker processes.
+    first = MemoryStore(SQLiteMemoryBackend(path), max_tokens=100_000)
+    second = MemoryStore(SQLiteMemoryBackend(path), max_tokens=100_000)
+
+    threads = [threading.Thread(target=_concurrent_turns, args=(store, "u:doc")) for store in (first, second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    messages = first.load("u:doc")
+    assert len(messages) == 2 * 2 * TURNS_PER_THREAD * THREADS
+
+
+def test_redis_concurrent_turns_are_not_lost():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = MemoryStore(RedisMemoryBackend(client=fakeredis.FakeRedis()), max_tokens=100_000)
+    _concurrent_turns(store, "u:doc")
+    _assert_no_lost_turns(store, "u:doc")
+
+
+def test_append_trims_to_the_token_budget():
+    store = MemoryStore(LRUMemoryBackend(), max_tokens=5)
+    for i in range(10):
+        store.append("k", [HumanMessage(content=f"question number {i}"), AIMessage(content=f"answer {i}")])
+
+    messages = store.load("k")
+    assert [m.content for m in messages] == ["question number 9", "answer 9"]
+    assert store.stats()["messages_trimmed"] == 18
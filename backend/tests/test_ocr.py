@@ -0,0 +1,27 @@
+import os
+
+import fitz
+
+from app.services import ocr
+
+
+def _write_pdf(path, pages):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+
+
+def test_worker_doc_reopened_when_file_replaced(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    _write_pdf(path, 1)
+    first = ocr._open_worker_doc(path)
+    assert first.page_count == 1
+    assert ocr._open_worker_doc(path) is first
+
+    # Refreshed in place, the way the blob cache does after an ETag change.
+    tmp = str(tmp_path / "doc.pdf.tmp")
+    _write_pdf(tmp, 3)
+    os.replace(tmp, path)
+    assert ocr._open_worker_doc(path).page_count == 3
@@ -0,0 +1,29 @@
+from app.services.extraction import PageText
+from app.services.parse_cache import ParseCache
+
+
+def test_writer_streams_pages_into_a_readable_entry(tmp_path):
+    cache = ParseCache(root=str(tmp_path))
+    writer = cache.writer("doc")
+    writer.add_pages([PageText(1, "first", False, False), PageText(2, "zweite Seite", False, True)])
+    assert cache.get("doc") is None  # nothing visible before commit
+    writer.add_pages([PageText(3, "third", False, False)])
+    writer.commit({"retrieval": [(0, 5, 1)]})
+
+    parsed = cache.get("doc")
+    assert [(p.page_number, p.text, p.ocr) for p in parsed.pages] == [
+        (1, "first", False),
+        (2, "zweite Seite", True),
+        (3, "third", False),
+    ]
+    assert parsed.chunks == {"retrieval": [(0, 5, 1)]}
+
+
+def test_aborted_writer_leaves_no_entry(tmp_path):
+    cache = ParseCache(root=str(tmp_path))
+    writer = cache.writer("doc")
+    writer.add_pages([PageText(1, "first", False, False)])
+    writer.abort()
+
+    assert cache.get("doc") is None
+    assert list((tmp_path / "entries").iterdir()) == []
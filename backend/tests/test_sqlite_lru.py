@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.ocr_cache import OcrCache
+from app.services.sqlite_lru import MAX_PARAMS, SQLiteLRUStore
+
+
+def test_get_many_batches_and_misses(tmp_path):
+    store = SQLiteLRUStore(str(tmp_path / "lru.sqlite3"), "items", max_bytes=10 ** 9)
+    keys = [f"k{i}" for i in range(MAX_PARAMS + 10)]
+    store.put_many((key, key.encode()) for key in keys)
+    found = store.get_many(keys + ["missing"])
+    assert len(found) == len(keys)
+    assert found["k3"] == b"k3"
+    assert store.get("missing") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = SQLiteLRUStore(str(tmp_path / "lru.sqlite3"), "items", max_bytes=30, evict_every=1, evict_batch=1)
+    store.put("a", b"x" * 9)
+    store.put("b", b"x" * 9)
+    store.get("a")  # now b is the oldest
+    store.put("c", b"x" * 9)
+    store.put("d", b"x" * 9)
+    assert set(store.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+    assert store.stats()["bytes"] <= 30
+
+
+def test_caches_round_trip_through_store(tmp_path):
+    ocr = OcrCache(str(tmp_path / "ocr.sqlite3"))
+    ocr.put("page", "héllo")
+    assert ocr.get("page") == "héllo"
+    assert ocr.stats()["entries"] == 1
+
+    embeddings = EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    embeddings.put_many("model", ["a  b"], [[0.5, 1.0]])
+    vectors = embeddings.get_many("model", ["a b", "other"])
+    assert np.allclose(vectors[0], [0.5, 1.0]) and vectors[1] is None
+    assert embeddings.stats()["hits"] == 1 and embeddings.stats()["misses"] == 1
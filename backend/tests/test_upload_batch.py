@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from app.utils.azure_blob_utils import upload_batch
+
+
+async def _upload(name, fail=False, delay=0.0):
+    await asyncio.sleep(delay)
+    if fail:
+        raise RuntimeError(f"{name} failed")
+    return name
+
+
+def test_failed_upload_discards_the_completed_ones():
+    discarded = []
+
+    async def discard(name):
+        discarded.append(name)
+
+    async def run():
+        return await upload_batch(
+            [_upload("a"), _upload("b", fail=True, delay=0.01), _upload("c", delay=0.02)], discard
+        )
+
+    with pytest.raises(RuntimeError, match="b failed"):
+        asyncio.run(run())
+    assert discarded == ["a", "c"]
+
+
+def test_successful_batch_keeps_everything():
+    discarded = []
+
+    async def discard(name):
+        discarded.append(name)
+
+    assert asyncio.run(upload_batch([_upload("a"), _upload("b")], discard)) == ["a", "b"]
+    assert discarded == []
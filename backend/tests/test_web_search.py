@@ -0,0 +1,67 @@
+import asyncio
+
+from app.services import web_search as web_search_module
+from app.services.web_search import NO_RESULTS, FakeSearchProvider, SearchResult, WebSearch, WebSearchProvider
+
+FEES = [SearchResult("Fees", "The fee is 2%.", "https://example.com/fees")]
+
+
+def test_repeated_query_is_served_from_cache():
+    provider = FakeSearchProvider({"What is the fee?": FEES})
+    search = WebSearch(provider, timeout=1, ttl=60)
+
+    async def run():
+        first = await search.search("What is the fee?")
+        second = await search.search("  what is the FEE ")  # same normalized query
+        return first, second
+
+    assert asyncio.run(run()) == (FEES, FEES)
+    assert provider.calls == 1
+    assert search.stats()["cache_hits"] == 1
+
+
+def test_expired_entry_is_fetched_again(monkeypatch):
+    provider = FakeSearchProvider({"fee": FEES})
+    search = WebSearch(provider, timeout=1, ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(web_search_module.time, "time", lambda: now[0])
+
+    asyncio.run(search.search("fee"))
+    now[0] += 61
+    asyncio.run(search.search("fee"))
+
+    assert provider.calls == 2
+
+
+def test_concurrent_searches_share_one_provider_call():
+    provider = FakeSearchProvider({"fee": FEES}, delay=0.05)
+    search = WebSearch(provider, timeout=1, ttl=60)
+
+    async def run():
+        return await asyncio.gather(search.search("fee"), search.search("fee"))
+
+    assert asyncio.run(run()) == [FEES, FEES]
+    assert provider.calls == 1
+
+
+def test_timeout_yields_no_results_and_is_not_cached():
+    provider = FakeSearchProvider({"fee": FEES}, delay=0.5)
+    search = WebSearch(provider, timeout=0.05, ttl=60)
+
+    assert asyncio.run(search.search_text("fee")) == NO_RESULTS
+    assert asyncio.run(search.search("fee")) == []
+    assert provider.calls == 2
+    assert search.stats()["timeouts"] == 2
+
+
+def test_provider_error_yields_no_results():
+    class Failing(WebSearchProvider):
+        name = "failing"
+
+        async def search(self, query, max_results):
+            raise ConnectionError("offline")
+
+    search = WebSearch(Failing(), timeout=1, ttl=60)
+
+    assert asyncio.run(search.search_text("fee")) == NO_RESULTS
+    assert search.stats()["errors"] == 1
@@ -37,7 +37,7 @@ function UploadPage() {
     setError('');
 
     if (!files || files.length === 0) {
-      setError('❗ Please select at least one PDF file.');
+      setError('❗ Please select at least one document.');
       return;
     }
 
@@ -98,11 +98,11 @@ function UploadPage() {
         {/* ✅ Upload form */}
         <form onSubmit={handleSubmit}>
           <div className="mb-3">
-            <label className="form-label">Select PDF Documents:</label>
+            <label className="form-label">Select Documents (PDF, Word or images):</label>
             <input
               type="file"
               multiple
-              accept="application/pdf"
+              accept="application/pdf,.docx,application/vnd.openxmlformats-officedocument.wordprocessingml.document,image/*"
               className="form-control"
               onChange={handleFileChange}
             />